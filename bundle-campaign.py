@@ -0,0 +1,49 @@
+#!/usr/bin/python
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import sys
+
+from chrono.model.campaign import JikibanCampaign
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pack a ChronoShift campaign and its levels into a single file")
+    parser.add_argument('campaign', type=str,
+                        help="The campaign file (or bundle) to pack")
+    parser.add_argument('bundle', type=str,
+                        help="The campaign bundle to write (usually ending in .lsb)")
+    args = parser.parse_args()
+
+    jc = JikibanCampaign()
+    try:
+        jc.load_campaign(args.campaign)
+        jc.save_bundle(args.bundle)
+    except IOError, e:
+        print "E: campaign %s: %s" % (args.campaign, " ".join(str(x) for x in e.args))
+        sys.exit(1)
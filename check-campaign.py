@@ -30,23 +30,37 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import argparse
 import sys
 
+from chrono import checker
 from chrono.model.campaign import JikibanCampaign
-from chrono.model.level import Level
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Check ChronoShift campaigns")
+    checker.add_arguments(parser)
     parser.add_argument('campaigns', type=str, nargs='+',
                         help="The campaigns files to check")
     args = parser.parse_args()
 
+    tasks = []
+    failed = False
     for campaign in args.campaigns:
         jc = JikibanCampaign()
-        jc.load_campaign(campaign)
-        for lvlfile in jc:
-            lvl = Level()
-            lvl.load_level(lvlfile)
+        try:
+            jc.load_campaign(campaign)
+        except IOError, e:
+            print "E: campaign %s: %s" % (campaign, " ".join(str(x) for x in e.args))
+            failed = True
+            continue
+        if not jc.is_bundle:
+            tasks.extend((lvlfile, "solvable") for lvlfile in jc)
+            continue
+        for i, lvlfile in enumerate(jc):
             try:
-                lvl.check_lvl(require_solution=1)
-            except TimeParadoxError, e:
-                print " ".join(e.args)
-                sys.exit(1)
+                tasks.append((lvlfile, "solvable", jc.level_content(i)))
+            except IOError, e:
+                print "E: campaign %s: %s" % (campaign, " ".join(str(x) for x in e.args))
+                failed = True
+
+    code = checker.main(args, tasks, "check-campaign")
+    if failed:
+        code = 1
+    sys.exit(code)
@@ -30,7 +30,7 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import argparse
 import sys
 
-from chrono.model.level import Level, TimeParadoxError
+from chrono import checker
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Check ChronoShift levels")
@@ -41,21 +41,16 @@ if __name__ == "__main__":
     parser.add_argument('--test-time-paradox', action="store_const", dest="timeparadox",
                         const=True, default=False,
                         help="Fail unless a solution leads to a time-paradox")
+    checker.add_arguments(parser)
     parser.add_argument('levels', type=str, nargs='+',
                         help="The level files to check")
     args = parser.parse_args()
 
-    require_solution = args.solvable or args.timeparadox
-
-    for lvlfile in args.levels:
-        lvl = Level()
-        lvl.load_level(lvlfile)
-        try:
-            lvl.check_lvl(verbose=args.verbose, require_solution=require_solution)
-            if args.timeparadox:
-                print "E: lvl %s: Expected time-paradox, but non occured" % lvl.name
-                sys.exit(1)
-        except TimeParadoxError, e:
-            if not args.timeparadox:
-                print " ".join(e.args)
-                sys.exit(1)
+    mode = "check"
+    if args.timeparadox:
+        mode = "time-paradox"
+    elif args.solvable:
+        mode = "solvable"
+
+    tasks = [(lvlfile, mode) for lvlfile in args.levels]
+    sys.exit(checker.main(args, tasks, "check-level", verbose=args.verbose))
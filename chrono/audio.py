@@ -0,0 +1,93 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import pygame
+
+class AudioPlayer(object):
+    """Play sound effects and background music
+
+    Sound effects are decoded into memory (via load_sound) the first
+    time they are played.  Music is streamed from its file with
+    pygame.mixer.music, so it is neither decoded up front nor kept in
+    memory.  Only one music track plays at a time.
+
+    The mixer must have been initialized before anything is played.
+
+    @param load_sound The function used to load a sound effect
+    (defaults to pygame.mixer.Sound).
+    """
+
+    def __init__(self, load_sound=None):
+        if load_sound is None:
+            load_sound = pygame.mixer.Sound
+        self.load_sound = load_sound
+        self._effects = {}
+        self._loaded = {}
+        self._music = {}
+        self._current_music = None
+
+    def add_effect(self, name, path):
+        """Register a sound effect (it is loaded when first played)"""
+        self._effects[name] = path
+        self._loaded.pop(name, None)
+
+    def add_music(self, name, path):
+        """Register a music track (it is streamed when played)"""
+        self._music[name] = path
+
+    def __contains__(self, name):
+        return name in self._effects or name in self._music
+
+    def play(self, name, loops=0, volume=1):
+        """Play a sound effect or a music track
+
+        Playing a music track replaces the current one.
+
+        @param name The name of the effect or track.
+        @param loops The number of extra times to play it (-1 means
+        forever).
+        @param volume The volume (between 0 and 1).
+        """
+        if name in self._music:
+            music = pygame.mixer.music
+            if self._current_music != name:
+                music.load(self._music[name])
+                self._current_music = name
+            music.set_volume(volume)
+            music.play(loops)
+            return
+        sound = self._loaded.get(name)
+        if sound is None:
+            sound = self._loaded[name] = self.load_sound(self._effects[name])
+        sound.set_volume(volume)
+        sound.play(loops)
+
+    def stop(self):
+        """Stop all sound effects and the music"""
+        pygame.mixer.stop()
+        pygame.mixer.music.stop()
@@ -0,0 +1,273 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import hashlib
+import json
+import multiprocessing
+import os
+import StringIO
+import sys
+import time
+import traceback
+from xml.sax.saxutils import quoteattr, escape
+
+from chrono.model.level import Level, GameError, TimeParadoxError
+from chrono.model.levelcache import LevelCache
+
+# Bump whenever a change to the game logic (or the checks) may change
+# the verdict of a level, so cached verdicts are discarded.
+CACHE_VERSION = 4
+
+CheckResult = collections.namedtuple('CheckResult', [
+    'name', 'ok', 'messages', 'duration', 'cached'
+])
+
+def check_level(name, content, mode, level_cache=None):
+    """Check a single level
+
+    @param name The name of the level (usually its path).
+    @param content The content of the level file.
+    @param mode Either "check" (the solution must be valid if
+    present), "solvable" (the level must have a valid solution) or
+    "time-paradox" (the solution must lead to a time-paradox).
+    @param level_cache A LevelCache to load the level from or None.
+    @return A CheckResult.  Its messages are the warnings and errors
+    that would have been written to stdout.  If the check crashes
+    (e.g. on a malformed level), the result is a failure with the
+    traceback as its messages.
+    """
+    start = time.time()
+    out = StringIO.StringIO()
+    ok = True
+    saved_stdout = sys.stdout
+    # check_lvl writes its warnings to stdout
+    sys.stdout = out
+    try:
+        lvl = Level()
+        if level_cache is not None:
+            level_cache.load_level(lvl, name, content=content)
+        else:
+            lvl.load_level(name, StringIO.StringIO(content))
+        lvl.check_lvl(require_solution=(mode != "check"))
+        if mode == "time-paradox":
+            print "E: lvl %s: Expected time-paradox, but non occured" % name
+            ok = False
+    except TimeParadoxError, e:
+        if mode != "time-paradox":
+            print " ".join(e.args)
+            ok = False
+    except (GameError, IOError), e:
+        msg = " ".join(str(x) for x in e.args)
+        if not msg.startswith("E: "):
+            msg = "E: lvl %s: %s" % (name, msg)
+        print msg
+        ok = False
+    except Exception, e:
+        # A bad level must not abort the checks of the other levels
+        print "E: lvl %s: Internal error while checking: %s" % (name, repr(e))
+        print traceback.format_exc().rstrip()
+        ok = False
+    finally:
+        sys.stdout = saved_stdout
+    messages = out.getvalue().splitlines()
+    return CheckResult(name, ok, messages, time.time() - start, False)
+
+def _check_level_task(task):
+    return check_level(*task)
+
+class VerdictCache(object):
+    """Cache of verdicts keyed by the content of the level files
+
+    The cache is stored as a JSON file.  A verdict is only reused if
+    the level file, the check mode and CACHE_VERSION are unchanged.
+    """
+
+    def __init__(self, fname):
+        self._fname = fname
+        self._verdicts = {}
+        self._dirty = False
+        if os.path.exists(fname):
+            with open(fname) as fd:
+                data = json.load(fd)
+            if data.get("version") == CACHE_VERSION:
+                self._verdicts = data["verdicts"]
+
+    @staticmethod
+    def key(name, content, mode):
+        h = hashlib.sha1()
+        h.update("%d\0%s\0%s\0" % (CACHE_VERSION, mode, name))
+        h.update(content)
+        return h.hexdigest()
+
+    def get(self, key):
+        return self._verdicts.get(key)
+
+    def put(self, key, result):
+        self._verdicts[key] = {"ok": result.ok, "messages": result.messages}
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp = self._fname + ".tmp"
+        with open(tmp, "w") as fd:
+            json.dump({"version": CACHE_VERSION, "verdicts": self._verdicts}, fd)
+        os.rename(tmp, self._fname)
+        self._dirty = False
+
+def run_checks(tasks, jobs=1, cache=None, level_cache=None):
+    """Check a number of levels
+
+    @param tasks A sequence of (name, mode) pairs or (name, mode,
+    content) triples.  For pairs, the level is read from the file name.
+    @param jobs The number of processes to use.
+    @param cache A VerdictCache or None.
+    @param level_cache A LevelCache or None.
+    @return An iterator over the CheckResults (in the order of tasks).
+    Errors reading a level file are reported as a failed check.
+    """
+    results = []
+    pending = []
+    keys = {}
+    for task in tasks:
+        name, mode = task[:2]
+        if len(task) > 2:
+            content = task[2]
+        else:
+            try:
+                with open(name) as fd:
+                    content = fd.read()
+            except IOError, e:
+                msg = "E: lvl %s: %s" % (name, e.strerror)
+                results.append(CheckResult(name, False, [msg], 0.0, False))
+                continue
+        key = None
+        if cache is not None:
+            key = VerdictCache.key(name, content, mode)
+            verdict = cache.get(key)
+            if verdict is not None:
+                results.append(CheckResult(name, verdict["ok"], verdict["messages"],
+                                           0.0, True))
+                continue
+        keys[len(results)] = key
+        pending.append((name, content, mode, level_cache))
+        # Placeholder for the result
+        results.append(None)
+
+    if jobs > 1 and len(pending) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(pending)))
+        checked = pool.imap(_check_level_task, pending)
+    else:
+        pool = None
+        checked = (check_level(*task) for task in pending)
+
+    try:
+        for idx, result in enumerate(results):
+            if result is None:
+                result = next(checked)
+                if cache is not None:
+                    cache.put(keys[idx], result)
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if cache is not None:
+            cache.save()
+
+def write_report(fname, results, suite="chrono"):
+    """Write a report of the checked levels
+
+    The report is written as JUnit XML if fname ends with ".xml" and
+    as JSON otherwise.
+    """
+    failures = sum(1 for r in results if not r.ok)
+    total_time = sum(r.duration for r in results)
+    with open(fname, "w") as fd:
+        if not fname.endswith(".xml"):
+            levels = [r._asdict() for r in results]
+            json.dump({"suite": suite, "levels": levels, "failures": failures,
+                       "time": total_time}, fd, indent=2, sort_keys=True)
+            fd.write("\n")
+            return
+        fd.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        fd.write('<testsuite name=%s tests="%d" failures="%d" time="%.3f">\n'
+                 % (quoteattr(suite), len(results), failures, total_time))
+        for r in results:
+            fd.write('  <testcase classname=%s name=%s time="%.3f">'
+                     % (quoteattr(suite), quoteattr(r.name), r.duration))
+            text = escape("\n".join(r.messages))
+            if not r.ok:
+                fd.write('<failure message="level check failed">%s</failure>' % text)
+            elif r.cached:
+                fd.write('<system-out>(cached) %s</system-out>' % text)
+            elif text:
+                fd.write('<system-out>%s</system-out>' % text)
+            fd.write('</testcase>\n')
+        fd.write('</testsuite>\n')
+
+def add_arguments(parser):
+    """Add the options for run_checks and write_report to an ArgumentParser"""
+    parser.add_argument('--jobs', '-j', type=int, default=1, dest="jobs",
+                        help="Number of levels to check in parallel")
+    parser.add_argument('--cache', type=str, default=None, dest="cache",
+                        help="Remember verdicts in this file and skip unchanged levels")
+    parser.add_argument('--level-cache', type=str, default=None, dest="level_cache",
+                        help="Store compiled levels in this directory and load"
+                        + " unchanged levels from there")
+    parser.add_argument('--report', type=str, default=None, dest="report",
+                        help="Write a report to this file (JUnit XML if it ends"
+                        + " with .xml, JSON otherwise)")
+
+def main(args, tasks, suite, verbose=False):
+    """Check levels as specified by the parsed command line arguments
+
+    Prints the result of each check and returns the exit code.
+    """
+    cache = None
+    if args.cache is not None:
+        cache = VerdictCache(args.cache)
+    level_cache = None
+    if args.level_cache is not None:
+        level_cache = LevelCache(args.level_cache)
+    results = []
+    for result in run_checks(tasks, jobs=args.jobs, cache=cache,
+                             level_cache=level_cache):
+        if verbose:
+            extra = ""
+            if result.cached:
+                extra = " (cached)"
+            print "Checking %s ...%s" % (result.name, extra)
+        for msg in result.messages:
+            print msg
+        results.append(result)
+    if args.report is not None:
+        write_report(args.report, results, suite=suite)
+    if all(r.ok for r in results):
+        return 0
+    return 1
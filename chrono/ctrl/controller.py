@@ -35,6 +35,8 @@ from pgu import gui
 
 from chrono.ctrl.diag import (ConfirmDialog, MessageDialog, OptionsDialog,
                               SelectFileDialog)
+from chrono.model import opcodes
+from chrono.model.level import actions2solution
 
 DEFAULT_PLAY_CONTROLS = {
     pg.K_UP: 'move-up',
@@ -54,6 +56,16 @@ DEFAULT_PLAY_CONTROLS = {
 
     pg.K_F2: 'print-actions',
     pg.K_j: 'reset-time-jump',
+
+    pg.K_u: 'undo-move',
+    pg.K_BACKSPACE: 'undo-move',
+    pg.K_r: 'redo-move',
+
+    pg.K_COMMA: 'seek-back',
+    pg.K_PERIOD: 'seek-forward',
+    pg.K_PAGEUP: 'seek-previous-jump',
+    pg.K_PAGEDOWN: 'seek-next-jump',
+    pg.K_END: 'end-review',
 }
 
 class KeyController(object):
@@ -103,7 +115,14 @@ class PlayKeyController(KeyController):
             'skip-turn': self.perform_move,
             'enter-time-machine': self.perform_move,
             'reset-time-jump': self.perform_move,
+            'undo-move': self.perform_move,
+            'redo-move': self.perform_move,
             'print-actions': self._print_actions,
+            'seek-back': self._seek,
+            'seek-forward': self._seek,
+            'seek-previous-jump': self._seek,
+            'seek-next-jump': self._seek,
+            'end-review': self._seek,
         }
 
     def event(self, e):
@@ -137,13 +156,14 @@ class PlayKeyController(KeyController):
             return
         l = self.level
         current_clone = l.active_player
-        if action == "enter-time-machine":
+        op = opcodes.encode(action)
+        if op == opcodes.ENTER_TIME_MACHINE:
             if l.turn[0] < 1:
                 # turn 1, we are sure the "current self" is active and outside
                 # the time machine
                 diag = ConfirmDialog("Do you really want to end the current time-jump in turn %d?" \
                                          % self.level.turn[0])
-                diag.connect(gui.CHANGE, l.perform_move, action)
+                diag.connect(gui.CHANGE, l.perform_move, op)
                 diag.open()
                 return # Don't consume here or the dialog won't work
             if not current_clone:
@@ -157,16 +177,44 @@ class PlayKeyController(KeyController):
                 MessageDialog("The player must be on top of the time machine to enter it.",
                             "Illegal move").open()
                 return # Don't consume here or the dialog won't work
-        if self.confirm_eot_on_start and action == "skip-turn":
+        if self.confirm_eot_on_start and op == opcodes.SKIP_TURN:
             if (current_clone is not None and
                     current_clone.position == l.start_location.position):
                 diag = ConfirmDialog("Do you really want to skip your time on the time machine?")
-                diag.connect(gui.CHANGE, l.perform_move, action)
+                diag.connect(gui.CHANGE, l.perform_move, op)
                 diag.open()
                 return # Don't consume here or the dialog won't work
 
 
-        l.perform_move(action)
+        l.perform_move(op)
+        return True
+
+    def _seek(self, action):
+        if not self.level:
+            return
+        l = self.level
+        jump = l.number_of_clones
+        turn = l.turn[0]
+        try:
+            if action == 'seek-back':
+                if turn > 0:
+                    l.seek(jump, turn - 1)
+                elif jump > 1:
+                    # The last turn of the previous time-jump
+                    l.seek(jump - 1, l.turn[1])
+            elif action == 'seek-forward':
+                if l.seek(jump, turn + 1) == turn and l.reviewing:
+                    l.seek(jump + 1, 0)
+            elif action == 'seek-previous-jump':
+                if jump > 1:
+                    l.seek(jump - 1, 0)
+            elif action == 'seek-next-jump':
+                if l.reviewing:
+                    l.seek(jump + 1, 0)
+            else:
+                l.end_review()
+        except ValueError as e:
+            MessageDialog(str(e), "Cannot review").open()
         return True
 
     def _print_actions(self, _):
@@ -219,25 +267,5 @@ class PlayKeyController(KeyController):
         mdiag.open()
 
     def _gen_action_string(self):
-        def _action2sf(container):
-            actions = {
-                'move-up': 'N',
-                'move-right': 'E',
-                'move-down': 'S',
-                'move-left': 'W',
-                'skip-turn': 'H',
-                'enter-time-machine': 'T',
-            }
-            it = iter(container)
-
-            while 1:
-                a = next(it)
-                b = next(it, None)
-                if b is None:
-                    yield actions[a]
-                    break
-                yield actions[a] + actions[b]
-
         for clone in self.level.iter_clones():
-            yield " ".join(_action2sf(clone))
-
+            yield actions2solution(clone.timeline)
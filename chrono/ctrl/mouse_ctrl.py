@@ -163,9 +163,6 @@ class EditMouseController(MouseController):
         if self._brush_mode != "none":
             # not hiligthing anything, we don't care
             return
-        if evt.event_type != "field-connected" and evt.event_type != "field-disconnected":
-            # We only care for those two events...
-            return
         # figure out what hilight appears/disappears (if any)
         hipos = None
         marked = self.active_pos
@@ -201,7 +198,8 @@ class EditMouseController(MouseController):
         if old_lvl:
             old_lvl.remove_event_listener(self._edit_event)
         if new_lvl:
-            new_lvl.add_event_listener(self._edit_event)
+            new_lvl.add_event_listener(self._edit_event,
+                                       ["field-connected", "field-disconnected"])
 
 
     def _restore_hilights(self):
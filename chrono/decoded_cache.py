@@ -0,0 +1,203 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Cache of decoded images and sounds
+#
+# Decoding the PNGs and converting the WAV files to the format of the
+# mixer is a large part of the start up time on slow machines.  The
+# cache stores the result as raw pixels and PCM samples, so the next
+# start only has to read them.  Entries are keyed by the path of the
+# source file plus the format of the decoded data (so a changed mixer
+# setting simply results in a new entry).  Like compiled levels (see
+# chrono.model.levelcache), an entry records the mtime, size and SHA-1
+# of its source file.  It is up to date if the mtime and size are
+# unchanged or, failing that, the SHA-1 is unchanged.  So normally only
+# the entry itself is read.
+
+import hashlib
+import os
+import struct
+import wave
+
+import pygame
+
+# Bump whenever the layout of the cache files changes
+FORMAT_VERSION = 2
+
+# mtime, size and SHA-1 of the source file (in front of every entry)
+_SOURCE_HEADER = struct.Struct("<dQ20s")
+
+# magic, pixel format ("RGBA" or "RGB"), width, height, has colorkey,
+# colorkey (RGB)
+_IMAGE_HEADER = struct.Struct("<4s4sHHB3s")
+_IMAGE_MAGIC = "CSIM"
+# magic, frequency, sample size, channels
+_SOUND_HEADER = struct.Struct("<4sihH")
+_SOUND_MAGIC = "CSPC"
+
+class DecodedCache(object):
+    """Cache directory of decoded images and sounds
+
+    load_image and load_sound are drop-in replacements for
+    pygame.image.load and pygame.mixer.Sound (for files).
+
+    @param cache_dir The directory of the cache (created if needed).
+    """
+
+    def __init__(self, cache_dir):
+        self._cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def _entry(self, path, kind):
+        base = os.path.basename(path)
+        key = hashlib.sha1(os.path.abspath(path)).hexdigest()[:16]
+        return os.path.join(self._cache_dir, "%s-%s-%s-v%d"
+                            % (base, key, kind, FORMAT_VERSION))
+
+    def _lookup(self, path, entry):
+        """Returns the decoded data of path stored in entry (or None)
+
+        None is returned if the entry is missing or out of date.
+        """
+        st = os.stat(path)
+        data = self._read(entry)
+        if data is None or len(data) < _SOURCE_HEADER.size:
+            return None
+        mtime, size, digest = _SOURCE_HEADER.unpack_from(data)
+        if st.st_size != size:
+            return None
+        decoded = buffer(data, _SOURCE_HEADER.size)
+        if st.st_mtime != mtime:
+            with open(path, "rb") as fd:
+                if hashlib.sha1(fd.read()).digest() != digest:
+                    return None
+            # Unchanged content (e.g. touched); refresh the mtime so the
+            # next lookup need not hash the file
+            self._write(entry, _SOURCE_HEADER.pack(st.st_mtime, size, digest),
+                        decoded)
+        return decoded
+
+    def _store(self, path, entry, header, data):
+        st = os.stat(path)
+        with open(path, "rb") as fd:
+            digest = hashlib.sha1(fd.read()).digest()
+        source = _SOURCE_HEADER.pack(st.st_mtime, st.st_size, digest)
+        self._write(entry, source + header, data)
+
+    def _read(self, fname):
+        try:
+            with open(fname, "rb") as fd:
+                return fd.read()
+        except IOError:
+            return None
+
+    def _write(self, fname, header, data):
+        tmp = "%s.%d.tmp" % (fname, os.getpid())
+        try:
+            with open(tmp, "wb") as fd:
+                fd.write(header)
+                fd.write(data)
+            os.rename(tmp, fname)
+        except (IOError, OSError):
+            # The cache is only an optimization
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def load_image(self, path):
+        """Load an image (like pygame.image.load)
+
+        The image is returned as an RGB or RGBA surface (with the
+        colorkey of the original image, if any).
+        """
+        entry = self._entry(path, "img")
+        data = self._lookup(path, entry)
+        if data is not None and len(data) >= _IMAGE_HEADER.size:
+            magic, fmt, width, height, has_key, key = _IMAGE_HEADER.unpack_from(data)
+            fmt = fmt.rstrip("\0")
+            if (magic == _IMAGE_MAGIC and fmt in ("RGB", "RGBA") and
+                    len(data) == _IMAGE_HEADER.size + width * height * len(fmt)):
+                image = pygame.image.frombuffer(buffer(data, _IMAGE_HEADER.size),
+                                                (width, height), fmt)
+                if has_key:
+                    image.set_colorkey(tuple(bytearray(key)))
+                return image
+
+        image = pygame.image.load(path)
+        fmt = "RGB"
+        if image.get_flags() & pygame.SRCALPHA:
+            fmt = "RGBA"
+        colorkey = image.get_colorkey()
+        key = "\0\0\0"
+        if colorkey is not None:
+            key = str(bytearray(colorkey[:3]))
+        width, height = image.get_size()
+        header = _IMAGE_HEADER.pack(_IMAGE_MAGIC, fmt, width, height,
+                                    colorkey is not None, key)
+        self._store(path, entry, header, pygame.image.tostring(image, fmt))
+        return image
+
+    def load_sound(self, path):
+        """Load a sound (like pygame.mixer.Sound(path))
+
+        The mixer must have been initialized.  WAV files that are
+        already in the format of the mixer are not cached (the decoded
+        data would just be a copy of the file).
+        """
+        freq, size, channels = pygame.mixer.get_init()
+        if _in_mixer_format(path, freq, size, channels):
+            return pygame.mixer.Sound(path)
+        entry = self._entry(path, "pcm-%d-%d-%d" % (freq, size, channels))
+        data = self._lookup(path, entry)
+        if data is not None and len(data) >= _SOUND_HEADER.size:
+            header = _SOUND_HEADER.unpack_from(data)
+            if header == (_SOUND_MAGIC, freq, size, channels):
+                return pygame.mixer.Sound(buffer=buffer(data, _SOUND_HEADER.size))
+
+        sound = pygame.mixer.Sound(path)
+        header = _SOUND_HEADER.pack(_SOUND_MAGIC, freq, size, channels)
+        self._store(path, entry, header, sound.get_raw())
+        return sound
+
+def _in_mixer_format(path, freq, size, channels):
+    """Determine if path is an uncompressed WAV file in the mixer format"""
+    try:
+        wav = wave.open(path)
+    except (wave.Error, EOFError, IOError):
+        return False
+    try:
+        # 8-bit WAV samples are unsigned, 16-bit are signed
+        wav_size = wav.getsampwidth() * 8
+        if wav_size == 16:
+            wav_size = -16
+        return (wav.getcomptype() == "NONE" and wav.getframerate() == freq and
+                wav_size == size and wav.getnchannels() == channels)
+    finally:
+        wav.close()
@@ -0,0 +1,220 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Static analysis of a level
+#
+# The analysis only looks at the layout and the wiring of the level;
+# nothing is replayed.  It is optimistic: gates are assumed to be open
+# whenever needed (unless nothing can ever open them) and crates and
+# other clones never block the way.  Anything it reports as
+# unreachable is therefore unreachable in every play of the level.
+
+from chrono.model.direction import Direction
+from chrono.model.field import Button, Pallet
+
+_DIRECTIONS = (Direction.NORTH, Direction.EAST, Direction.SOUTH, Direction.WEST)
+
+def blocked_cells(level):
+    """Determine the cells that can never be entered
+
+    These are the walls plus the closed gates without any sources (as
+    nothing can ever open them).
+
+    @param level The level (a BaseLevel).
+    @return A bytearray with a non-zero value for each blocked cell
+    (indexed by cell index).
+    """
+    grid = level.grid
+    blocked = bytearray(grid.width * grid.height)
+    for idx in xrange(len(blocked)):
+        if grid.is_wall_index(idx):
+            blocked[idx] = 1
+    for field in grid.iter_special_fields():
+        if (field.is_activation_target and not field.can_enter and
+                next(iter(field.iter_activation_sources()), None) is None):
+            blocked[grid.index(field.position)] = 1
+    return blocked
+
+def reachable_cells(level, blocked=None):
+    """Flood-fill the cells a clone can reach from the start location
+
+    @param level The level (a BaseLevel).
+    @param blocked The result of blocked_cells(level) (computed if None).
+    @return A bytearray with a non-zero value for each cell a clone
+    may reach (indexed by cell index).
+    """
+    grid = level.grid
+    if blocked is None:
+        blocked = blocked_cells(level)
+    reach = bytearray(len(blocked))
+    start = grid.index(level.start_location.position)
+    reach[start] = 1
+    stack = [start]
+    while stack:
+        idx = stack.pop()
+        for d in _DIRECTIONS:
+            n = grid.neighbour(idx, d)
+            if n < 0 or reach[n] or blocked[n]:
+                continue
+            reach[n] = 1
+            stack.append(n)
+    return reach
+
+def crate_reachable_cells(level, crate_pos, reach=None, blocked=None):
+    """Determine the cells a crate may be pushed to
+
+    A crate can be pushed from one cell to the next if the next cell
+    can be entered and a clone can reach the cell behind the crate.
+    Other crates are ignored.
+
+    @param level The level (a BaseLevel).
+    @param crate_pos The (initial) position of the crate.
+    @param reach The result of reachable_cells(level) (computed if None).
+    @param blocked The result of blocked_cells(level) (computed if None).
+    @return A bytearray with a non-zero value for each cell the crate
+    may end up in (including its initial cell).
+    """
+    grid = level.grid
+    if blocked is None:
+        blocked = blocked_cells(level)
+    if reach is None:
+        reach = reachable_cells(level, blocked)
+    seen = bytearray(len(blocked))
+    start = grid.index(crate_pos)
+    seen[start] = 1
+    stack = [start]
+    while stack:
+        idx = stack.pop()
+        for d in _DIRECTIONS:
+            n = grid.neighbour(idx, d)
+            if n < 0 or seen[n] or blocked[n]:
+                continue
+            behind = grid.neighbour(idx, (d + 2) % 4)
+            if behind < 0 or not reach[behind]:
+                continue
+            seen[n] = 1
+            stack.append(n)
+    return seen
+
+def dead_cells(level, reach=None, blocked=None):
+    """Determine the "dead squares" of the level
+
+    A dead square is a cell from which a crate can never be pushed onto
+    a button or a pallet.  They are found by pulling crates back from
+    the buttons and pallets: a crate can be pulled from p to q = p + d
+    if q can be entered and a clone can reach p + 2 * d (from where it
+    pushes the crate back to p).  Every cell a crate can be pulled to
+    is alive; the remaining (enterable) cells are dead.
+
+    @param level The level (a BaseLevel).
+    @param reach The result of reachable_cells(level) (computed if None).
+    @param blocked The result of blocked_cells(level) (computed if None).
+    @return A bytearray with a non-zero value for each dead square
+    (indexed by cell index).
+    """
+    grid = level.grid
+    if blocked is None:
+        blocked = blocked_cells(level)
+    if reach is None:
+        reach = reachable_cells(level, blocked)
+    live = bytearray(len(blocked))
+    stack = []
+    for field in grid.iter_special_fields():
+        if isinstance(field, Button):
+            idx = grid.index(field.position)
+            if not blocked[idx]:
+                live[idx] = 1
+                stack.append(idx)
+    while stack:
+        idx = stack.pop()
+        for d in _DIRECTIONS:
+            prev = grid.neighbour(idx, d)
+            if prev < 0 or live[prev] or blocked[prev]:
+                continue
+            pusher = grid.neighbour(prev, d)
+            if pusher < 0 or not reach[pusher]:
+                continue
+            live[prev] = 1
+            stack.append(prev)
+    dead = bytearray(len(blocked))
+    for idx in xrange(len(blocked)):
+        if not live[idx] and not blocked[idx]:
+            dead[idx] = 1
+    return dead
+
+def analyse_level(level):
+    """Statically check a level for issues
+
+    @param level The level (a BaseLevel).
+    @return A list of (severity, message) pairs, where severity is
+    either "E" (the level cannot be solved) or "W".  The messages
+    do not include the name of the level.
+    """
+    issues = []
+    grid = level.grid
+    if level.start_location is None or level.goal_location is None:
+        return issues
+    blocked = blocked_cells(level)
+    reach = reachable_cells(level, blocked)
+    goal = level.goal_location.position
+    if not reach[grid.index(goal)]:
+        issues.append(("E", "goal at %s cannot be reached from the start location"
+                       % str(goal)))
+
+    # Without buttons and pallets, crates can only be obstacles, so
+    # there is no point in looking for dead squares.
+    has_targets = any(isinstance(f, Button) for f in grid.iter_special_fields())
+    dead = None
+    if has_targets:
+        dead = dead_cells(level, reach, blocked)
+    pushable = bytearray(len(blocked))
+    for crate in level.iter_crates():
+        cells = crate_reachable_cells(level, crate.position, reach, blocked)
+        if sum(cells) == 1:
+            issues.append(("W", "crate at %s can never be moved"
+                           % str(crate.position)))
+        elif dead is not None and all(dead[idx] for idx, c in enumerate(cells) if c):
+            issues.append(("W", "crate at %s can only be pushed between dead squares"
+                           " (it can never reach a button or a pallet)"
+                           % str(crate.position)))
+        for idx, c in enumerate(cells):
+            if c:
+                pushable[idx] = 1
+
+    for field in grid.iter_special_fields():
+        if not field.is_activation_source:
+            continue
+        idx = grid.index(field.position)
+        if isinstance(field, Pallet):
+            if not pushable[idx]:
+                issues.append(("W", "pallet at %s cannot be reached by any crate"
+                               % str(field.position)))
+        elif not reach[idx]:
+            issues.append(("W", "activator (%s) at %s cannot be reached"
+                           % (field.symbol, str(field.position))))
+    return issues
@@ -0,0 +1,111 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from chrono.model.direction import Direction
+
+class Bitboards(object):
+    """Bitsets over the cells of a level (see Level.enable_bitboards)
+
+    Each bitset is a Python int, where bit i represents the cell with
+    index i in the LevelGrid of the level (i.e. y * width + x).
+
+     - walls: cells with a wall
+     - closed: fields that currently cannot be entered (e.g. closed
+       gates)
+     - crates: cells with a crate
+     - clones: cells with at least one clone
+
+    The level keeps the bitsets (except walls) in sync with its state.
+    They must not be modified by others.
+
+    @param grid The LevelGrid of the level.
+    """
+
+    def __init__(self, grid):
+        width = grid.width
+        size = width * grid.height
+        self._width = width
+        self.all = (1 << size) - 1
+        self.walls = sum(1 << i for i in xrange(size) if grid.is_wall_index(i))
+        self.closed = 0
+        self.crates = 0
+        self.clones = 0
+        first_column = sum(1 << i for i in xrange(0, size, width))
+        self._not_first_column = self.all & ~first_column
+        self._not_last_column = self.all & ~(first_column << (width - 1))
+
+    @property
+    def blocked(self):
+        """The cells that cannot be entered (walls and closed fields)"""
+        return self.walls | self.closed
+
+    @property
+    def occupied(self):
+        """The cells a crate cannot be pushed onto"""
+        return self.walls | self.closed | self.crates | self.clones
+
+    def shift(self, bits, direction):
+        """Move every cell in bits to its neighbour in a direction
+
+        Cells whose neighbour is outside the grid are dropped.
+        """
+        if direction == Direction.NORTH:
+            return bits >> self._width
+        if direction == Direction.SOUTH:
+            return (bits << self._width) & self.all
+        if direction == Direction.EAST:
+            return (bits & self._not_last_column) << 1
+        if direction == Direction.WEST:
+            return (bits & self._not_first_column) >> 1
+        return bits
+
+    def pushable_crates(self, direction):
+        """The crates that can be pushed in a direction
+
+        A crate can be pushed if the cell behind it (in the direction)
+        is free.  Whether a clone can reach the crate is not considered.
+        """
+        free = self.all & ~self.occupied
+        return self.crates & self.shift(free, (direction + 2) % 4)
+
+    def can_move(self, index, direction):
+        """Determine if a clone on a cell can move in a direction
+
+        Uses the same rules as the level does at the start of a turn:
+        The neighbour must exist and be enterable and a crate on it must
+        be pushable.
+
+        @param index The cell index of the clone.
+        @param direction The direction (not Direction.NO_ACT).
+        """
+        target = self.shift(1 << index, direction)
+        if not target or target & self.blocked:
+            return False
+        if target & self.crates:
+            return bool(self.shift(target, direction) & ~self.occupied)
+        return True
@@ -25,20 +25,56 @@ LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
 NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
+import hashlib
 import itertools
+import mmap
 import os
+import struct
+import StringIO
+
+# Campaign bundles
+#
+# A bundle packs the levels of a campaign into a single file, so they
+# can be loaded without opening a file per level.  It consists of a
+# header (see _BUNDLE_HEADER), an index with an entry per level (see
+# _BUNDLE_ENTRY, followed by the name of the level) and the
+# content of the level files.  The offsets in the index are relative
+# to the start of the bundle.  All numbers are little endian.
+
+BUNDLE_MAGIC = "JikiBan Bundle\0\0"
+BUNDLE_VERSION = 1
+
+# magic, version, number of levels
+_BUNDLE_HEADER = struct.Struct("<16sHxxI")
+# offset, size, SHA-1 of the content, length of the name
+_BUNDLE_ENTRY = struct.Struct("<QI20sH")
 
 class JikibanCampaign(object):
+    """A campaign (an ordered list of levels)
+
+    A campaign is either a campaign file (listing level files relative
+    to the campaign file) or a campaign bundle (see save_bundle).  In
+    either case, campaign[i] is the name of the i'th level and
+    open_level(i) returns a file descriptor with its content.
+    """
 
     def __init__(self):
         self._dirname = ""
         self._level_names = []
+        # The content of a bundle (an mmap or a str) and its index as
+        # (offset, size, digest) triples; None for campaign files
+        self._bundle = None
+        self._index = None
 
     def load_campaign(self, fname, infd=None, leveldir=None):
         if infd is None:
-            with open(fname) as fd:
+            with open(fname, "rb") as fd:
                 return self.load_campaign(fname, infd=fd, leveldir=leveldir)
 
+        if infd.read(len(BUNDLE_MAGIC)) == BUNDLE_MAGIC:
+            return self._load_bundle(fname, infd)
+        infd.seek(0)
+
         dirname = leveldir
         if dirname is None:
             dirname = os.path.dirname(fname)
@@ -64,6 +100,93 @@ class JikibanCampaign(object):
 
         self._level_names = level_names
         self._dirname = dirname
+        self._bundle = None
+        self._index = None
+
+    def _load_bundle(self, fname, infd):
+        try:
+            data = mmap.mmap(infd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, EnvironmentError, ValueError):
+            # Not a real file (e.g. a StringIO)
+            infd.seek(0)
+            data = infd.read()
+        if len(data) < _BUNDLE_HEADER.size:
+            raise IOError("Truncated campaign bundle %s" % fname)
+        _, version, count = _BUNDLE_HEADER.unpack_from(data)
+        if version != BUNDLE_VERSION:
+            raise IOError("Unsupported version (%d) of campaign bundle %s"
+                          % (version, fname))
+        offset = _BUNDLE_HEADER.size
+        names = []
+        index = []
+        for _ in xrange(count):
+            if offset + _BUNDLE_ENTRY.size > len(data):
+                raise IOError("Truncated campaign bundle %s" % fname)
+            start, size, digest, namelen = _BUNDLE_ENTRY.unpack_from(data, offset)
+            offset += _BUNDLE_ENTRY.size
+            if offset + namelen > len(data):
+                raise IOError("Truncated campaign bundle %s" % fname)
+            name = data[offset:offset + namelen]
+            offset += namelen
+            if start + size > len(data):
+                raise IOError("Campaign bundle %s refers to data outside the file (%s)"
+                              % (fname, name))
+            names.append(name)
+            index.append((start, size, digest))
+
+        self._level_names = names
+        self._dirname = fname
+        self._bundle = data
+        self._index = index
+
+    @property
+    def is_bundle(self):
+        """Whether the campaign was loaded from a campaign bundle"""
+        return self._bundle is not None
+
+    def level_content(self, index):
+        """Returns the content of a level
+
+        For bundles, the content is checked against the SHA-1 in the
+        index (an IOError is raised if they do not match).
+        """
+        if self._bundle is None:
+            with open(self[index], "rb") as fd:
+                return fd.read()
+        start, size, digest = self._index[index]
+        content = self._bundle[start:start + size]
+        if hashlib.sha1(content).digest() != digest:
+            raise IOError("Level %s is corrupt" % self[index])
+        return content
+
+    def open_level(self, index):
+        """Returns a file descriptor with the content of a level
+
+        The result can be passed to BaseLevel.load_level as infd.
+        """
+        return StringIO.StringIO(self.level_content(index))
+
+    def save_bundle(self, fname, fd=None):
+        """Write the campaign (including its levels) as a campaign bundle"""
+        # Read all levels first; fname may be the bundle they are read from
+        contents = [self.level_content(i) for i in xrange(len(self))]
+        if fd is None:
+            with open(fname, "wb") as outfd:
+                return self._write_bundle(outfd, contents)
+        return self._write_bundle(fd, contents)
+
+    def _write_bundle(self, fd, contents):
+        names = self._level_names
+        offset = _BUNDLE_HEADER.size
+        offset += sum(_BUNDLE_ENTRY.size + len(n) for n in names)
+        fd.write(_BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(names)))
+        for name, content in itertools.izip(names, contents):
+            digest = hashlib.sha1(content).digest()
+            fd.write(_BUNDLE_ENTRY.pack(offset, len(content), digest, len(name)))
+            fd.write(name)
+            offset += len(content)
+        for content in contents:
+            fd.write(content)
 
     def save_campaign(self, fname, fd=None):
         if fd is None:
@@ -0,0 +1,137 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Crate deadlocks
+#
+# Crates follow the Sokoban push rules, so the usual Sokoban tables
+# apply: a "dead square" is a cell from which a crate can never be
+# pushed onto a button or a pallet, and a crate is "frozen" when it
+# can never be pushed again.
+#
+# Unlike Sokoban, a level does not require every crate to end on a
+# target, so a crate on a dead square is not a deadlock by itself.  A
+# frozen crate is a permanent wall for the rest of the time-jump,
+# though (crates are reset by a time-jump).
+
+from chrono.model.analysis import blocked_cells, dead_cells, reachable_cells
+from chrono.model.direction import Direction
+
+_AXES = ((Direction.NORTH, Direction.SOUTH), (Direction.EAST, Direction.WEST))
+
+class DeadlockTables(object):
+    """Dead-square table and freeze detection for the crates of a level
+
+    The tables only depend on the layout and the wiring of the level,
+    so they are computed once (per level) and remain valid while the
+    level is played.  All cells are given as cell indices of the
+    LevelGrid of the level.
+
+    @param level The level (a BaseLevel).
+    """
+
+    def __init__(self, level):
+        grid = level.grid
+        self._grid = grid
+        self._goal = grid.index(level.goal_location.position)
+        self.blocked = blocked_cells(level)
+        self.reach = reachable_cells(level, self.blocked)
+        self.dead = dead_cells(level, self.reach, self.blocked)
+
+    def is_dead(self, idx):
+        """Determine if a crate on idx can never reach a button or a pallet"""
+        return bool(self.dead[idx])
+
+    def is_frozen(self, idx, crates):
+        """Determine if the crate on idx can never be pushed again
+
+        A crate is stuck along an axis if it has a wall (or a gate that
+        cannot open) on either side, or a frozen crate on either side.
+        It is frozen if it is stuck along both axes.
+
+        @param idx The cell of the crate.
+        @param crates A container of the cells of all crates.
+        """
+        return self._frozen(idx, crates, set())
+
+    def _frozen(self, idx, crates, visiting):
+        # Crates being visited are considered walls (otherwise two
+        # crates next to each other would depend on each other)
+        visiting.add(idx)
+        grid = self._grid
+        blocked = self.blocked
+        for axis in _AXES:
+            stuck = False
+            for d in axis:
+                n = grid.neighbour(idx, d)
+                if n < 0 or blocked[n] or n in visiting:
+                    stuck = True
+                    break
+                if n in crates and self._frozen(n, crates, visiting):
+                    stuck = True
+                    break
+            if not stuck:
+                visiting.discard(idx)
+                return False
+        visiting.discard(idx)
+        return True
+
+    def frozen_crates(self, crates):
+        """Returns the set of frozen crates
+
+        @param crates A container of the cells of all crates.
+        """
+        return set(idx for idx in crates if self.is_frozen(idx, crates))
+
+    def goal_reachable(self, sources, frozen):
+        """Determine if a clone can still reach the goal location
+
+        Like reachable_cells, except the frozen crates are walls.
+
+        @param sources The cells of the clones (and the start location).
+        @param frozen A container of the cells of the frozen crates.
+        """
+        grid = self._grid
+        blocked = self.blocked
+        seen = bytearray(len(blocked))
+        stack = []
+        for idx in sources:
+            if not seen[idx]:
+                seen[idx] = 1
+                stack.append(idx)
+        goal = self._goal
+        while stack:
+            idx = stack.pop()
+            if idx == goal:
+                return True
+            for d in xrange(4):
+                n = grid.neighbour(idx, d)
+                if n < 0 or seen[n] or blocked[n] or n in frozen:
+                    continue
+                seen[n] = 1
+                stack.append(n)
+        return False
@@ -32,6 +32,11 @@ from chrono.model.position import Position
 from chrono.model.direction import Direction
 
 class Field(object):
+
+    # [source-only] Whether the targets are toggled when the source
+    # changes its state
+    toggles_targets = True
+
     def __init__(self, symbol, position=None):
         self._symbol = symbol
         self._is_source = False
@@ -39,6 +44,9 @@ class Field(object):
         self._activated = False
         self._targets = set()
         self._sources = set()
+        # Sorted tuples of _targets and _sources (None if out of date)
+        self._sorted_targets = None
+        self._sorted_sources = None
         self._pos = position
         self._init_state = False
 
@@ -97,6 +105,7 @@ class Field(object):
             raise ValueError("%s does not accept %s as target" % (self.symbol, target.symbol))
 
         self._targets.add(target)
+        self._sorted_targets = None
         target._add_source(self)
 
     def remove_activation_target(self, target):
@@ -107,6 +116,7 @@ class Field(object):
         # the resulting state is probably better than the initial one.
 
         self._targets.remove(target)
+        self._sorted_targets = None
         target._remove_source(self)
 
     def has_activation_target(self, target):
@@ -114,24 +124,26 @@ class Field(object):
 
     def _add_source(self, source):
         self._sources.add(source)
+        self._sorted_sources = None
 
     def _remove_source(self, source):
         self._sources.remove(source)
+        self._sorted_sources = None
 
     def _set_position(self, pos):
         self._pos = pos
 
     def iter_activation_targets(self):
-        # Technically we could just do return sorted(...), but this
-        # way we force it to be an iterator and require the "iter()"
-        # call.
-        return (x for x in sorted(self._targets, key=operator.attrgetter("position")))
+        if self._sorted_targets is None:
+            self._sorted_targets = tuple(sorted(self._targets,
+                                                key=operator.attrgetter("position")))
+        return iter(self._sorted_targets)
 
     def iter_activation_sources(self):
-        # Technically we could just do return sorted(...), but this
-        # way we force it to be an iterator and require the "iter()"
-        # call.
-        return (x for x in sorted(self._sources, key=operator.attrgetter("position")))
+        if self._sorted_sources is None:
+            self._sorted_sources = tuple(sorted(self._sources,
+                                                key=operator.attrgetter("position")))
+        return iter(self._sorted_sources)
 
     @property
     def is_wall(self):
@@ -143,13 +155,10 @@ class Field(object):
         returns True if the state of the field changes (some don't
         change every time), or False otherwise.
 
-        For sources, it will (automatically) dispatch a toggle_activation
-        for each of its targets.  For targets the state is simply changed.
+        The targets of a source are not changed by this; the level
+        toggles them if the state changes (and toggles_targets is True).
         """
         self._activated = not self._activated
-        if self.is_activation_source:
-            for t in self._targets:
-                t.toggle_activation(level)
         return True
 
     def reset_to_init_state(self):
@@ -168,10 +177,23 @@ class Field(object):
             return True
         return False
 
+    def _get_state(self):
+        """Returns the (dynamic) state of the field (see _set_state)"""
+        return self._activated
+
+    def _set_state(self, state):
+        """Restore a state previously returned by _get_state
+
+        Unlike toggle_activation, targets are not affected by this.
+        """
+        self._activated = state
+
     def copy(self):
         other = type(self)(self.symbol)
         other._sources = set()
         other._targets = set()
+        other._sorted_sources = None
+        other._sorted_targets = None
         other._activated = self._activated
         other._pos = self._pos
         return other
@@ -203,12 +225,15 @@ class Gate(Field):
             self._init_state = self._activated = True
 
     def toggle_activation(self, level=None):
-        self._activated = not self._activated
+        self._set_state(not self._activated)
+        return True
+
+    def _set_state(self, state):
+        self._activated = state
         if self._activated:
             self._symbol = '-'
         else:
             self._symbol = '_'
-        return True
 
     @property
     def can_enter(self):
@@ -229,8 +254,6 @@ class OneTimeButton(Button):
 
     def reset_to_init_state(self):
         if self.activated:
-            for target in self._targets:
-                target.toggle_activation()
             self._activated = False
             return True
         return False
@@ -238,6 +261,8 @@ class OneTimeButton(Button):
 class OneTimePassage(Field):
 
     stepped_on = False
+    # Its activation is a "heartbeat" that does not affect the targets
+    toggles_targets = False
 
     def __init__(self, *args, **kwords):
         super(OneTimePassage, self).__init__(*args, **kwords)
@@ -263,20 +288,33 @@ class OneTimePassage(Field):
             return True
         return False
 
+    def _get_state(self):
+        return (self._activated, self.stepped_on)
+
+    def _set_state(self, state):
+        self._activated, self.stepped_on = state
+
     @property
     def can_enter(self):
         return not self.activated
 
 class Pallet(Button):
 
-    def toggle_activation(self, level):
-        if not level is None:
-            if len(level.get_crates_with_target(self.position)) != 0:
-                return super(Pallet, self).toggle_activation(level)
-        else:
-            return super(Pallet, self).toggle_activation()
-        activated = False
-        return False
+    def toggle_activation(self, level=None):
+        """Toggles the activation if a crate is pushed onto the pallet
+        or if the pallet is left empty
+
+        Clones stepping on the pallet do not activate it, but the pallet
+        stays activated until neither a crate nor a clone occupies it.
+        """
+        if level is not None:
+            crates = level.get_crates_with_target(self.position)
+            if self.activated:
+                if crates or level.get_clones_with_target(self.position):
+                    return False
+            elif not crates:
+                return False
+        return super(Pallet, self).toggle_activation(level)
 
 class StartLocation(Field):
     pass
@@ -0,0 +1,279 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from array import array
+import threading
+
+from chrono.model.direction import Direction
+from chrono.model.field import Field, Wall, parse_field
+from chrono.model.position import Position
+
+WALL = ord('+')
+FIELD = ord(' ')
+
+# Plain fields are stored only as their code; all other fields are
+# kept as objects in the sparse table.
+_PLAIN_FIELDS = {
+    WALL: Wall,
+    FIELD: Field,
+}
+
+# The position and neighbour tables only depend on the size of the
+# grid (and are never modified), so grids of the same size share them.
+# Only the tables of the most recently used sizes are kept.
+_TABLES = {}
+_TABLES_ORDER = []
+_TABLES_LOCK = threading.Lock()
+MAX_CACHED_TABLES = 8
+
+def _get_tables(width, height):
+    key = (width, height)
+    with _TABLES_LOCK:
+        tables = _TABLES.get(key)
+        if tables is not None:
+            _TABLES_ORDER.remove(key)
+            _TABLES_ORDER.append(key)
+            return tables
+    tables = _make_tables(width, height)
+    with _TABLES_LOCK:
+        if key not in _TABLES:
+            _TABLES_ORDER.append(key)
+            while len(_TABLES_ORDER) > MAX_CACHED_TABLES:
+                del _TABLES[_TABLES_ORDER.pop(0)]
+        _TABLES[key] = tables
+    return tables
+
+class LevelGrid(object):
+    """Compact storage of the fields of a level
+
+    Every cell of the grid has a one-byte code (the symbol of the field
+    in the level format) stored in a flat bytearray in row-major order.
+    Walls and plain fields are stored only as their code; the Field
+    objects for them are created on demand by get_field (and reused by
+    later calls for the same cell).  All other
+    fields (buttons, gates, the start and the goal location etc.) are
+    stored as Field objects in a sparse table indexed by cell.
+
+    The grid also has a table of (interned) positions and the cell
+    indices of the 4 neighbours of each cell (-1 if the neighbour is
+    outside the grid), so neighbours can be found without creating new
+    Position objects.
+    """
+
+    def __init__(self, width, height, cells=None, _tables=None):
+        self._width = width
+        self._height = height
+        if cells is None:
+            cells = bytearray('+' * (width * height))
+        self._cells = cells
+        self._special = {}
+        # Field objects of plain cells created by get_field
+        self._plain = {}
+        if _tables is None:
+            _tables = _get_tables(width, height)
+        self._positions, self._neighbours = _tables
+
+    @property
+    def width(self):
+        return self._width
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def cells(self):
+        """The bytearray with the code of each cell (must not be modified)"""
+        return self._cells
+
+    def index(self, pos):
+        """Returns the cell index of a position in the grid
+
+        Raises IndexError if the position is outside the grid.
+        """
+        if not (0 <= pos.x < self._width and 0 <= pos.y < self._height):
+            raise IndexError("%s is outside the grid" % str(pos))
+        return pos.y * self._width + pos.x
+
+    def position(self, idx):
+        """Returns the (interned) position of a cell index"""
+        return self._positions[idx]
+
+    def neighbour(self, idx, direction):
+        """Returns the index of the neighbour of a cell (or -1)
+
+        @param idx The index of the cell.
+        @param direction The direction of the neighbour (one of
+        Direction.NORTH, EAST, SOUTH and WEST).
+        @return The cell index of the neighbour or -1 if the neighbour is
+        outside the grid.
+        """
+        return self._neighbours[direction][idx]
+
+    def neighbour_position(self, pos, direction):
+        """Returns the position next to pos in a given direction
+
+        Like pos.dir_pos(direction), except the returned position is the
+        interned position of the cell (if it is inside the grid).
+        """
+        x, y = pos
+        w = self._width
+        if 0 <= x < w and 0 <= y < self._height:
+            idx = self._neighbours[direction][y * w + x]
+            if idx >= 0:
+                return self._positions[idx]
+        return pos.dir_pos(direction)
+
+    def get_field(self, pos):
+        idx = self.index(pos)
+        field = self._special.get(idx)
+        if field is None:
+            field = self._plain.get(idx)
+            if field is None:
+                code = self._cells[idx]
+                field = _PLAIN_FIELDS[code](chr(code), position=self._positions[idx])
+                self._plain[idx] = field
+        return field
+
+    def get_special_field(self, pos):
+        """Returns the field at pos or None if it is a plain wall or field"""
+        return self._special.get(self.index(pos))
+
+    def set_field(self, pos, field):
+        """Replace the field at a given position
+
+        The position of the field is updated to pos.
+        """
+        idx = self.index(pos)
+        field._set_position(pos)
+        if type(field) in (Wall, Field):
+            # A crate may have left a "c" as symbol
+            self._cells[idx] = WALL if field.is_wall else FIELD
+            self._special.pop(idx, None)
+            self._plain[idx] = field
+        else:
+            self._cells[idx] = ord(field.symbol)
+            self._special[idx] = field
+            self._plain.pop(idx, None)
+
+    def is_wall(self, pos):
+        return self._cells[self.index(pos)] == WALL
+
+    def is_wall_index(self, idx):
+        """Determine if the cell is a wall (cells outside the grid, i.e. -1, are)"""
+        return idx < 0 or self._cells[idx] == WALL
+
+    def can_enter(self, pos):
+        """Determine if pos can be entered (positions outside the grid cannot)"""
+        x, y = pos
+        w = self._width
+        if not (0 <= x < w and 0 <= y < self._height):
+            return False
+        idx = y * w + x
+        field = self._special.get(idx)
+        if field is None:
+            return self._cells[idx] != WALL
+        return field.can_enter
+
+    def row_symbols(self, y):
+        """Returns the symbols of a row (as a bytearray)"""
+        w = self._width
+        row = self._cells[y * w:(y + 1) * w]
+        for x in xrange(w):
+            field = self._special.get(y * w + x)
+            if field is not None:
+                row[x] = field.symbol
+        return row
+
+    def iter_fields(self):
+        """Iterate over all fields (column by column)"""
+        w = self._width
+        for x in xrange(w):
+            for y in xrange(self._height):
+                yield self.get_field(self._positions[y * w + x])
+
+    def iter_special_fields(self):
+        """Iterate over all fields that are not plain walls or fields
+
+        The fields are returned in the same order as iter_fields.
+        """
+        w = self._width
+        for idx in sorted(self._special, key=lambda i: (i % w, i // w)):
+            yield self._special[idx]
+
+    def copy(self):
+        """Copy the grid (activation sources and targets are not connected)"""
+        other = LevelGrid(self._width, self._height, cells=self._cells[:],
+                          _tables=(self._positions, self._neighbours))
+        for idx, field in self._special.iteritems():
+            other._special[idx] = field.copy()
+        return other
+
+def _make_tables(width, height):
+    """Create the position and neighbour tables for a grid"""
+    size = width * height
+    positions = tuple(Position(i % width, i // width) for i in xrange(size))
+    north = array('i', (i - width if i >= width else -1 for i in xrange(size)))
+    south = array('i', (i + width if i < size - width else -1 for i in xrange(size)))
+    east = array('i', (i + 1 if i % width < width - 1 else -1 for i in xrange(size)))
+    west = array('i', (i - 1 if i % width else -1 for i in xrange(size)))
+    neighbours = [None] * 4
+    neighbours[Direction.NORTH] = north
+    neighbours[Direction.EAST] = east
+    neighbours[Direction.SOUTH] = south
+    neighbours[Direction.WEST] = west
+    return positions, tuple(neighbours)
+
+def parse_grid(lines):
+    """Create a grid from the map section of a level
+
+    @param lines The lines of the map (which must have the same width).
+    @return A tuple of the grid and the positions of the crates.
+    """
+    return grid_from_cells(len(lines[0]), len(lines), bytearray("".join(lines)))
+
+def grid_from_cells(width, height, cells):
+    """Create a grid from the cell codes of a map
+
+    @param width The width of the map.
+    @param height The height of the map.
+    @param cells A bytearray with the symbol of each cell (row-major
+    order).  It is used as storage of the grid.
+    @return A tuple of the grid and the positions of the crates.
+    """
+    grid = LevelGrid(width, height, cells=cells)
+    crates = []
+    for idx, code in enumerate(cells):
+        if code == WALL or code == FIELD:
+            continue
+        pos = grid.position(idx)
+        field = parse_field(chr(code))
+        if code == ord('c'):
+            crates.append(pos)
+        grid.set_field(pos, field)
+    return grid, crates
@@ -26,44 +26,39 @@ NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import collections
 import functools
-from itertools import (imap, ifilter, chain, izip, takewhile, product,
-                       starmap)
+from itertools import imap, ifilter, chain, izip, takewhile
 from operator import attrgetter
 import re
 
-from chrono.model.direction import Direction
+from chrono.model.analysis import analyse_level
+from chrono.model.bitboard import Bitboards
 from chrono.model.moveable import PlayerClone, Crate
-from chrono.model.field import (parse_field, Position, Wall, Field, Gate, Button,
+from chrono.model.field import (Position, Wall, Field, Gate, Button,
                                 StartLocation, GoalLocation, OneTimeButton,
                                 OneTimePassage,Pallet)
+from chrono.model.grid import LevelGrid, parse_grid
+from chrono.model import opcodes
+from chrono.model.zobrist import ZobristKeys
 
 ACTITVATION_REGEX = re.compile(
   r'^button\s+\(\s*(\d+)\s*,\s*(\d+)\s*\)\s*->\s*(\S+)\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)\s*$'
 )
 
-def solution2actions(sol, naive_replay=True):
-    """Transform a solution in "solution format" to actions
+def solution2opcodes(sol, naive_replay=True):
+    """Transform a solution in "solution format" to opcodes
 
     @param sol The solution in the "solution format".  Spaces and periods
     are ignored.
     @param naive_replay Assume that the consumer of the solution is just
     naively proccessing the reply and insert "skip-turn"s as needed for
     jumps to finish.
-    @return An iterable sequence of actions.
+    @return An iterable sequence of opcodes (see chrono.model.opcodes).
     """
 
     space = lambda x: not x[0].isspace() and x[0] != "."
-    def _s2actions(x):
-        if x == "N": return "move-up"
-        if x == "E": return "move-right"
-        if x == "S": return "move-down"
-        if x == "W": return "move-left"
-        if x == "H": return "skip-turn"
-        if x == "T": return "enter-time-machine"
-        raise ValueError("Unknown command %s" % x)
-
-    turn_gen = imap(_s2actions, ifilter(space, sol))
+    turn_gen = imap(opcodes.letter2opcode, ifilter(space, sol))
     if not naive_replay:
         return turn_gen
     def _gen_robust_solution(gen):
@@ -74,19 +69,45 @@ def solution2actions(sol, naive_replay=True):
         """
         cl = 0
         ml = 0
-        for act in gen:
+        for op in gen:
             cl += 1
-            yield act
-            if act == "enter-time-machine":
+            yield op
+            if op == opcodes.ENTER_TIME_MACHINE:
                 while cl < ml:
                     cl += 1
-                    yield "skip-turn"
+                    yield opcodes.SKIP_TURN
                 if cl > ml:
                     ml = cl
                 cl = 0
 
     return _gen_robust_solution(turn_gen)
 
+def solution2actions(sol, naive_replay=True):
+    """Transform a solution in "solution format" to actions
+
+    Like solution2opcodes, except the actions are given by name
+    (e.g. "move-up").
+
+    @param sol The solution in the "solution format".
+    @param naive_replay See solution2opcodes.
+    @return An iterable sequence of actions.
+    """
+    return imap(opcodes.decode, solution2opcodes(sol, naive_replay=naive_replay))
+
+def actions2solution(actions):
+    """Transform the actions of a clone into "solution format"
+
+    The inverse of solution2actions (for a single clone).
+
+    @param actions An iterable of actions or opcodes (e.g. a PlayerClone
+    or its timeline).
+    @return The actions in "solution format" with the actions grouped
+    in pairs (e.g. "EE HS T").
+    """
+    letters = opcodes.LETTERS
+    sf = [letters[opcodes.encode(a)] for a in actions]
+    return " ".join("".join(sf[i:i+2]) for i in xrange(0, len(sf), 2))
+
 def _line_reader(fd):
     it = iter(fd)
     for line in fd:
@@ -105,10 +126,14 @@ class TimeParadoxError(UnsolvableError):
     pass
 
 class GameEvent(object):
-    def __init__(self, event_type, source=None, success=True):
+
+    __slots__ = ('_event_type', '_source', '_success', 'reason')
+
+    def __init__(self, event_type, source=None, success=True, reason=None):
         self._event_type = event_type
         self._source = source
         self._success = success
+        self.reason = reason
 
     @property
     def event_type(self):
@@ -123,6 +148,9 @@ class GameEvent(object):
         return self._success
 
 class EditorEvent(object):
+
+    __slots__ = ('_event_type', '_source', '_target')
+
     def __init__(self, event_type, source=None, target=None):
         self._event_type = event_type
         self._source = source
@@ -140,17 +168,55 @@ class EditorEvent(object):
     def target(self):
         return self._target
 
+LevelSnapshot = collections.namedtuple('LevelSnapshot', [
+    'turn_no', 'turn_max', 'score', 'got_goal', 'player_active',
+    'time_paradox', 'clones', 'crates', 'fields', 'parity', 'clones_hash',
+    'world_hash'
+])
+
+class _TurnDelta(object):
+    """The changes done to a Level during one turn (see Level._undo_move)
+
+    Only the old values are stored; the new values are the current
+    ones when the turn is undone.
+    """
+
+    __slots__ = ('state', 'op', 'active_clones', 'clones', 'crates', 'fields',
+                 'parity')
+
+    def __init__(self, state, op, active_clones):
+        self.state = state # (turn_no, turn_max, score, got_goal, player_active, time_paradox)
+        self.op = op # opcode of the player or None if the player did not act
+        self.active_clones = active_clones
+        self.clones = [] # (clone, old position)
+        self.crates = [] # (crate, old position, new position, crate it replaced)
+        self.fields = [] # (field, old state)
+        self.parity = [] # indices of toggled targets
+
 class BaseLevel(object):
 
+    # The class of the events emitted by the level
+    _event_class = GameEvent
+
     def __init__(self):
         self._name = None
         self._width = 0
         self._height = 0
-        self._lvl = []
+        self._grid = LevelGrid(0, 0)
         self._metadata = {}
         self._start_location = None
         self._goal_location = None
-        self._handlers = set()
+        # Pairs of listeners and the event types they listen for (None
+        # meaning "all events")
+        self._listeners = []
+        # event type -> handlers; event types not in the table go to the
+        # handlers in _catch_all
+        self._dispatch = {}
+        self._catch_all = ()
+        # Pairs of batch listeners and their event types plus the events
+        # of the current event sequence
+        self._batch_listeners = []
+        self._batch = []
 
         self._crates = {}
 
@@ -174,11 +240,20 @@ class BaseLevel(object):
     def goal_location(self):
         return self._goal_location
 
+    @property
+    def grid(self):
+        """The LevelGrid with the fields of the level (must not be modified)"""
+        return self._grid
+
     def get_metadata_raw(self, fname, default=None):
         return self._metadata.get(fname, default)
 
+    def iter_metadata_fields(self):
+        """iterate over the names of the metadata fields (in lower case)"""
+        return self._metadata.iterkeys()
+
     def get_field(self, p):
-        return self._lvl[p.x][p.y]
+        return self._grid.get_field(p)
 
     def get_crate_at(self, p):
         if p in self._crates:
@@ -192,23 +267,150 @@ class BaseLevel(object):
         The two positions are assumed to be adjacent.  Returns False
         otherwise.
         """
-        return self.get_field(destpos).can_enter
+        return self._grid.can_enter(destpos)
 
     def iter_fields(self):
         """iterate over all fields in the level"""
-        for row in self._lvl:
-            for field in row:
-                yield field
+        return self._grid.iter_fields()
 
-    def _emit_event(self, event):
-        for handler in self._handlers:
+    def iter_crates(self):
+        """iterate over all crates in the level"""
+        return self._crates.itervalues()
+
+    def _has_listeners(self, event_type=None):
+        """Determine if an event would be passed to any listener
+
+        If event_type is None, determine if the level has any listeners
+        at all.
+        """
+        if event_type is None:
+            return bool(self._listeners)
+        return bool(self._dispatch.get(event_type, self._catch_all))
+
+    def _emit_event(self, event_type, **kwords):
+        """Pass an event to the listeners
+
+        The event is only created if someone listens for it.  The
+        keyword arguments are passed to the constructor of the event.
+        """
+        handlers = self._dispatch.get(event_type, self._catch_all)
+        if not handlers:
+            return
+        event = self._event_class(event_type, **kwords)
+        for handler in handlers:
             handler(event)
 
-    def add_event_listener(self, handler):
-        self._handlers.add(handler)
+    def _update_dispatch(self):
+        catch_all = tuple(h for h, types in self._listeners if types is None)
+        event_types = set()
+        for _, types in self._listeners:
+            if types is not None:
+                event_types.update(types)
+        dispatch = {}
+        for et in event_types:
+            dispatch[et] = tuple(h for h, types in self._listeners
+                                 if types is None or et in types)
+        self._dispatch = dispatch
+        self._catch_all = catch_all
+
+    def add_event_listener(self, handler, event_types=None):
+        """Add a listener for events
+
+        @param handler A callable taking the event as argument.
+        @param event_types An iterable of the event types (e.g.
+        "time-jump") the handler will receive.  If None, it receives all
+        events.  If the handler is already a listener, it will receive
+        events of these types as well.
+        """
+        if event_types is not None:
+            event_types = frozenset(event_types)
+        for i, (h, types) in enumerate(self._listeners):
+            if h == handler:
+                if types is not None and event_types is not None:
+                    event_types = types | event_types
+                else:
+                    event_types = None
+                self._listeners[i] = (handler, event_types)
+                break
+        else:
+            self._listeners.append((handler, event_types))
+        self._update_dispatch()
 
     def remove_event_listener(self, handler):
-        self._handlers.remove(handler)
+        """Remove a listener (for all the event types it listens for)
+
+        Raises KeyError if handler is not a listener.
+        """
+        listeners = [x for x in self._listeners if x[0] != handler]
+        if len(listeners) == len(self._listeners):
+            raise KeyError(handler)
+        self._listeners = listeners
+        self._update_dispatch()
+
+    def add_batch_listener(self, handler, event_types=None):
+        """Add a listener for sequences of events
+
+        The handler is called once per event sequence (i.e. once per
+        turn or change) with a tuple of the events in the sequence.  If
+        event_types is not None, the tuple only contains the events of
+        those types.  The "end-of-event-sequence" event is only included
+        if the handler listens for it.  If the handler is already a batch
+        listener, it will receive events of these types as well.
+        """
+        if event_types is not None:
+            event_types = frozenset(event_types)
+        for i, (h, types) in enumerate(self._batch_listeners):
+            if h == handler:
+                if types is not None and event_types is not None:
+                    event_types = types | event_types
+                else:
+                    event_types = None
+                self._batch_listeners[i] = (handler, event_types)
+                break
+        else:
+            self._batch_listeners.append((handler, event_types))
+        self._update_batching()
+
+    def remove_batch_listener(self, handler):
+        """Remove a batch listener
+
+        Raises KeyError if handler is not a batch listener.
+        """
+        listeners = [x for x in self._batch_listeners if x[0] != handler]
+        if len(listeners) == len(self._batch_listeners):
+            raise KeyError(handler)
+        self._batch_listeners = listeners
+        self._update_batching()
+
+    def _update_batching(self):
+        internal = (self._add_to_batch, self._flush_batch)
+        self._listeners = [x for x in self._listeners if x[0] not in internal]
+        self._batch = []
+        if self._batch_listeners:
+            event_types = set()
+            for _, types in self._batch_listeners:
+                if types is None:
+                    event_types = None
+                    break
+                event_types.update(types)
+            if event_types is not None:
+                event_types = frozenset(event_types)
+            self._listeners.append((self._add_to_batch, event_types))
+            self._listeners.append((self._flush_batch,
+                                    frozenset(["end-of-event-sequence"])))
+        self._update_dispatch()
+
+    def _add_to_batch(self, event):
+        self._batch.append(event)
+
+    def _flush_batch(self, event):
+        batch = tuple(self._batch)
+        self._batch = []
+        for handler, types in self._batch_listeners:
+            if types is None:
+                handler(batch)
+            else:
+                handler(tuple(e for e in batch if e.event_type in types))
 
     def init_from_level(self, other):
         """Initialize level as copy of another level
@@ -222,14 +424,44 @@ class BaseLevel(object):
         self._goal_location = other.goal_location
         self._metadata = other._metadata.copy()
         self._crates = other._crates.copy()
-        self._lvl = [list(imap(lambda f: f.copy(), c)) for c in other._lvl]
+        self._grid = other._grid.copy()
         other2self = lambda x: self.get_field(x.position)
-        for of in other.iter_fields():
+        for of in other._grid.iter_special_fields():
             mf = self.get_field(of.position)
             if of.is_activation_source:
                 for mt in imap(other2self, of.iter_activation_targets()):
                     mf.add_activation_target(mt)
 
+    def init_from_tables(self, name, grid, crates, wiring, metadata):
+        """Init level from an already parsed level
+
+        Used to load compiled levels (see chrono.model.levelcache).
+        The tables are assumed to come from a valid level.
+
+        @param name The name of the level.
+        @param grid The LevelGrid of the level (it is not copied).
+        @param crates The positions of the crates.
+        @param wiring A sequence of (source, target) pairs of cell
+        indices; one for each connection.
+        @param metadata A dict of the metadata fields of the level.
+        """
+        self._name = name
+        self._grid = grid
+        self._width = grid.width
+        self._height = grid.height
+        self._start_location = None
+        self._goal_location = None
+        for obj in grid.iter_special_fields():
+            if obj.symbol == "S":
+                self._start_location = obj
+            elif obj.symbol == "G":
+                self._goal_location = obj
+        self._crates = dict((pos, Crate(pos)) for pos in crates)
+        field_at = lambda idx: grid.get_field(grid.position(idx))
+        for source, target in wiring:
+            field_at(source).add_activation_target(field_at(target))
+        self._metadata = metadata
+
     def load_level(self, fname, infd=None):
         """Init level from description stored in a file
 
@@ -265,29 +497,30 @@ class BaseLevel(object):
                 raise IOError("Wall missing on left or right side (%s:%d)" % (fname, lineno))
             lines.append(line)
 
-        transposed_lvl = [map(parse_field, x) for x in lines]
-        for (j, line) in enumerate(transposed_lvl):
-            for (i, obj) in enumerate(line):
-                pos = Position(i, j)
-                if obj.symbol == "S":
-                    if self._start_location is not None:
-                        raise IOError("Two start locations %s and %s (%s:%d)" \
-                                          % (str(pos), str(self._start_location.position),
-                                             fname, lineno))
-                    self._start_location = obj
-                if obj.symbol == "G":
-                    if self._goal_location is not None:
-                        raise IOError("Two goal locations %s and %s (%s:%d)" \
-                                          % (str(pos), str(self._goal_location.position),
-                                             fname, lineno))
-                    self._goal_location = obj
-                if lines[j][i] == "c":
-                    self._crates[pos] = Crate(pos)
-                obj._set_position(pos)
-
-        self._lvl = zip(*transposed_lvl)
-        self._width = len(self._lvl)
-        self._height = len(self._lvl[0])
+        if not lines:
+            raise IOError("Missing map (%s:%d)" % (fname, lineno))
+
+        grid, crates = parse_grid(lines)
+        for obj in grid.iter_special_fields():
+            pos = obj.position
+            if obj.symbol == "S":
+                if self._start_location is not None:
+                    raise IOError("Two start locations %s and %s (%s:%d)" \
+                                      % (str(pos), str(self._start_location.position),
+                                         fname, lineno))
+                self._start_location = obj
+            if obj.symbol == "G":
+                if self._goal_location is not None:
+                    raise IOError("Two goal locations %s and %s (%s:%d)" \
+                                      % (str(pos), str(self._goal_location.position),
+                                         fname, lineno))
+                self._goal_location = obj
+        for pos in crates:
+            self._crates[pos] = Crate(pos)
+
+        self._grid = grid
+        self._width = grid.width
+        self._height = grid.height
 
         for lineno, line in takewhile(non_empty_line, lineiter):
             if line == "nothing": # ignore
@@ -299,8 +532,12 @@ class BaseLevel(object):
                 raise IOError("Cannot parse button rule (%s:%d)" % (fname, lineno))
             bx, by, tfname, tx, ty = match.groups()
             bx, by, tx, ty = imap(int, (bx, by, tx, ty))
-            button = self._lvl[bx][by]
-            target = self._lvl[tx][ty]
+            try:
+                button = self.get_field(Position(bx, by))
+                target = self.get_field(Position(tx, ty))
+            except IndexError:
+                raise IOError("Button rule refers to a field outside the map (%s:%d)"
+                              % (fname, lineno))
             if tfname != "gate":
                 raise IOError("buttons can only activate gates (%s:%d)" % (fname, lineno))
             if not button.is_activation_source:
@@ -354,16 +591,18 @@ class BaseLevel(object):
         else:
             rules = 0
             fd.write("2D SuperFun!\n")
-            sym = lambda x: (self.get_crate_at(x.position) and "c") or x.symbol
-            for line in izip(*self._lvl):
-                fd.write("".join(imap(sym, line)))
+            for y in xrange(self._height):
+                line = self._grid.row_symbols(y)
+                for pos in self._crates:
+                    if pos.y == y:
+                        line[pos.x] = "c"
+                fd.write(str(line))
                 fd.write("\n")
 
             fd.write("\n")
 
-            for field in self.iter_fields():
-                if (field.symbol != "b" and field.symbol != "B" and
-                    field.symbol != "o"):
+            for field in self._grid.iter_special_fields():
+                if not field.is_activation_source:
                     continue
                 fieldname = "button"
                 tfieldname = "gate"
@@ -387,6 +626,10 @@ class BaseLevel(object):
 class Level(BaseLevel):
     """Playable level"""
 
+    # Number of turns between two checkpoints used by seek (0 disables
+    # the checkpoints and thereby seek)
+    checkpoint_interval = 16
+
     def __init__(self):
         super(Level, self).__init__()
 
@@ -398,10 +641,42 @@ class Level(BaseLevel):
         self._player_active = False # Is the current player controllable ?
         self._player = None # current player
         self._clones = [] # clones (in order of appearance)
-        self._actions = [] # actions done by current player (i.e. clone)
+        # clones that may still act in this time-jump (in order of appearance)
+        self._active_clones = []
+        self._actions = bytearray() # opcodes of the actions of the current player (i.e. clone)
+        self._clone_counts = {} # position -> number of clones on it
+        # position -> clones/crates moving to (or staying on) it in the
+        # current turn
+        self._clone_targets = {}
+        self._crate_targets = {}
         self._crates_orig = {} # memory variables
         self._sources = []
-
+        self._stateful = [] # fields with a dynamic state (sources and targets)
+        # The compiled activation graph (see _compile_activation)
+        self._targets = []
+        self._target_init = []
+        self._source_targets = {}
+        self._parity = bytearray()
+        # Cached parts of the last snapshot (None if changed since then)
+        self._crates_state = None
+        self._fields_state = None
+        self._parity_state = None
+        # Zobrist hashing of the state (see state_hash)
+        self._zobrist = None
+        self._clone_no = {} # clone -> index (in order of appearance)
+        self._stateful_no = {} # field -> index in _stateful
+        self._clones_hash = 0 # positions of the clones
+        self._world_hash = 0 # positions of the crates and states of the fields
+        self._bitboards = None # see enable_bitboards
+        # Changes done in each turn of the current time-jump (the
+        # latest last) and the turns that can be redone.
+        self._undo_log = []
+        self._redo_log = []
+        self._delta = None # the changes of the current turn (if recording)
+        # Snapshots of the level (one dict per time-jump, mapping turns to
+        # snapshots) and the (live) state to return to after reviewing.
+        self._checkpoints = []
+        self._review = None
 
     @property
     def score(self):
@@ -415,6 +690,72 @@ class Level(BaseLevel):
     def number_of_clones(self):
         return len(self._clones)
 
+    @property
+    def goal_obtained(self):
+        return self._got_goal
+
+    @property
+    def state_hash(self):
+        """A 64-bit hash of the state of the level
+
+        The hash covers the positions of the clones (and their order of
+        appearance), the positions of the crates, the states of the
+        fields, the turn number and whether the goal has been obtained,
+        the "current self" is active or a time-paradox has occurred.
+        It does not cover the score nor the actions of the clones.
+
+        The hash is maintained incrementally as the state changes.  Two
+        levels loaded from the same file have the same hash in the same
+        state (even in different processes).
+        """
+        keys = self._zobrist
+        h = self._clones_hash ^ self._world_hash ^ keys.turn(self._turn_no)
+        if self._got_goal:
+            h ^= keys.goal_obtained
+        if self._player_active:
+            h ^= keys.player_active
+        if self._time_paradox:
+            h ^= keys.time_paradox
+        return h
+
+    @property
+    def world_hash(self):
+        """A 64-bit hash of the positions of the crates and the states of the fields
+
+        Like state_hash, but without the clones, the turn number and the
+        other parts of the state.
+        """
+        return self._world_hash
+
+    @property
+    def bitboards(self):
+        """The Bitboards of the level or None (see enable_bitboards)"""
+        return self._bitboards
+
+    def enable_bitboards(self):
+        """Maintain Bitboards of the walls, crates, clones and closed fields
+
+        Once enabled, the bitboards (see the bitboards property) are kept
+        in sync with the state of the level.  Must be called after the
+        level has been started.
+        """
+        if self._bitboards is None:
+            self._bitboards = Bitboards(self._grid)
+            self._rebuild_bitboards()
+
+    def _rebuild_bitboards(self):
+        bb = self._bitboards
+        index = self._grid.index
+        bb.crates = sum(1 << index(p) for p in self._crates)
+        bb.clones = sum(1 << index(p) for p in self._clone_counts)
+        bb.closed = sum(1 << index(f.position) for f in self._stateful
+                        if not f.can_enter)
+
+    @property
+    def reviewing(self):
+        """True if the level is in a past state (see seek)"""
+        return self._review is not None
+
     @property
     def active_player(self):
         """Returns the current clone if the "current self" is currently controllable
@@ -427,19 +768,76 @@ class Level(BaseLevel):
         return self._player
 
     def get_clones_with_target(self, position):
-        clones_with_target = frozenset(c.target == position for c in self._clones)
-        return clones_with_target
-    
+        """Returns the clones moving to (or staying on) position this turn"""
+        return frozenset(self._clone_targets.get(position, ()))
+
     def get_crates_with_target(self, position):
-        crates_with_target = frozenset(self.get_crate_at(c).target == position for c in self._crates)
-        return crates_with_target
-    
+        """Returns the crates pushed to (or staying on) position this turn"""
+        return frozenset(self._crate_targets.get(position, ()))
+
+    def _schedule_clones(self):
+        """Rebuild the list of clones that still act in this time-jump
+
+        Must be called whenever clones are added or removed, or the turn
+        is changed by other means than ending a turn.  _do_end_of_turn
+        retires clones as their time-lines end.
+        """
+        turn = self._turn_no
+        player = self._player
+        self._active_clones = [c for c in self._clones if turn < len(c) or c is player]
+
+    def _rebuild_clone_index(self):
+        counts = {}
+        for c in self._clones:
+            counts[c.position] = counts.get(c.position, 0) + 1
+        self._clone_counts = counts
+        self._clone_no = dict((c, i) for i, c in enumerate(self._clones))
+
+    def _rehash(self):
+        """Recompute the hashes of the state from scratch (see state_hash)"""
+        keys = self._zobrist
+        index = self._grid.index
+        h = 0
+        for i, c in enumerate(self._clones):
+            h ^= keys.clone(i)[index(c.position)]
+        self._clones_hash = h
+        h = 0
+        for pos in self._crates:
+            h ^= keys.crate[index(pos)]
+        for i, f in enumerate(self._stateful):
+            h ^= keys.field(i, f._get_state())
+        self._world_hash = h
+        if self._bitboards is not None:
+            self._rebuild_bitboards()
+
+    def _field_changed(self, field, old_state):
+        """Update the hash after the state of a field changed from old_state"""
+        i = self._stateful_no[field]
+        keys = self._zobrist
+        self._world_hash ^= keys.field(i, old_state) ^ keys.field(i, field._get_state())
+        bb = self._bitboards
+        if bb is not None:
+            bit = 1 << self._grid.index(field.position)
+            if field.can_enter:
+                bb.closed &= ~bit
+            else:
+                bb.closed |= bit
+
+    def _clear_history(self):
+        """Forget the turns that can be undone or redone"""
+        self._undo_log = []
+        self._redo_log = []
+        self._delta = None
+
     def load_level(self, *args, **kwords):
         super(Level, self).load_level(*args, **kwords)
         self._crates_orig = self._crates.copy()
-        is_source = attrgetter("is_activation_source")
-        all_pos = starmap(Position, product(xrange(self._width), xrange(self._height)))
-        self._sources = list(ifilter(is_source, imap(self.get_field, all_pos)))
+        self._compile_activation()
+
+    def init_from_tables(self, *args, **kwords):
+        super(Level, self).init_from_tables(*args, **kwords)
+        self._crates_orig = self._crates.copy()
+        self._compile_activation()
 
     def init_from_level(self, other, *args, **kwords):
         if not other.start_location:
@@ -448,58 +846,309 @@ class Level(BaseLevel):
             raise ValueError("Missing goal location")
         super(Level, self).init_from_level(other,*args, **kwords)
         self._crates_orig = self._crates.copy()
+        self._compile_activation()
+
+    def _compile_activation(self):
+        """Compile the activation graph of the level
+
+        Every activation target (gate) gets an index.  For each source,
+        the indices of its targets are stored in _source_targets.  The
+        state of a target is its initial state XOR the parity of the
+        number of times its sources toggled it (stored in _parity).
+        """
         is_source = attrgetter("is_activation_source")
-        all_pos = starmap(Position, product(xrange(self._width), xrange(self._height)))
-        self._sources = list(ifilter(is_source, imap(self.get_field, all_pos)))
+        is_target = attrgetter("is_activation_target")
+        is_stateful = lambda f: f.is_activation_source or f.is_activation_target
+        fields = self._grid.iter_special_fields()
+        self._stateful = list(ifilter(is_stateful, fields))
+        self._sources = list(ifilter(is_source, self._stateful))
+        self._targets = list(ifilter(is_target, self._stateful))
+        index = dict((t, i) for i, t in enumerate(self._targets))
+        self._source_targets = dict((s, tuple(index[t] for t in s.iter_activation_targets()))
+                                    for s in self._sources)
+        self._target_init = [t.activated for t in self._targets]
+        self._parity = bytearray(len(self._targets))
+        self._stateful_no = dict((f, i) for i, f in enumerate(self._stateful))
+        self._zobrist = ZobristKeys(self._grid.width * self._grid.height,
+                                    len(self._stateful))
+        self._crates_state = None
+        self._fields_state = None
+        self._parity_state = None
 
     def start(self):
         self._score = 0
         self._turn_no = 0
         self._turn_max = 0
         self._time_paradox = False
-        self._actions = []
+        self._actions = bytearray()
         self._player = PlayerClone(self.start_location.position, self._actions)
         self._player_active = True
         self._clones = [self._player]
+        self._schedule_clones()
+        self._rebuild_clone_index()
+        self._clear_history()
         self._crates = self._crates_orig.copy()
-        self._emit_event(GameEvent('add-player-clone', source=self._player))
-        self._emit_event(GameEvent('end-of-event-sequence'))
+        self._crates_state = None
+        self._rehash()
+        self._review = None
+        self._checkpoints = []
+        self._checkpoint()
+        self._emit_event('add-player-clone', source=self._player)
+        self._emit_event('end-of-event-sequence')
+
+    def snapshot(self):
+        """Capture the dynamic state of the level
+
+        The returned snapshot is immutable and can be passed to restore
+        (any number of times) to bring the level back into the captured
+        state.  The time-lines of clones that have finished their
+        time-jump and parts of the state that did not change between
+        two snapshots are shared (rather than copied) between them.
+        """
+        player = self._player
+        # Only the time-line of the player can still change
+        clones = tuple((c, c.position, c.timeline if c is not player else bytearray(self._actions))
+                       for c in self._clones)
+        if self._crates_state is None:
+            self._crates_state = tuple(self._crates.iteritems())
+        if self._fields_state is None:
+            self._fields_state = tuple(f._get_state() for f in self._stateful)
+            self._parity_state = str(self._parity)
+        return LevelSnapshot(self._turn_no, self._turn_max, self._score, self._got_goal,
+                             self._player_active, self._time_paradox, clones,
+                             self._crates_state, self._fields_state, self._parity_state,
+                             self._clones_hash, self._world_hash)
+
+    def restore(self, snap):
+        """Restore the level to a state returned by snapshot
+
+        The snapshot must have been taken from this level (after it was
+        started).  Event listeners are informed of the changes as if the
+        moveables had "jumped" to their (restored) positions.
+
+        The turns played before the snapshot can neither be undone nor
+        reviewed (see seek) after this.
+        """
+        old = self._jump_state()
+        self._restore_state(snap)
+        self._clear_history()
+        self._review = None
+        self._checkpoints = []
+        self._checkpoint(snap)
+        self._notify_jump(old)
+
+    def _restore_state(self, snap):
+        (self._turn_no, self._turn_max, self._score, self._got_goal,
+         self._player_active, self._time_paradox) = snap[:6]
+
+        self._clones = []
+        for clone, pos, timeline in snap.clones:
+            clone.position = pos
+            clone._set_actions(timeline)
+            self._clones.append(clone)
+        self._player = self._clones[-1]
+        self._actions = bytearray(self._player.timeline)
+        self._player._set_actions(self._actions)
+        self._schedule_clones()
+        self._rebuild_clone_index()
+
+        self._crates = dict(snap.crates)
+        for pos, crate in snap.crates:
+            crate.position = pos
+        self._crates_state = snap.crates
+
+        for field, state in izip(self._stateful, snap.fields):
+            field._set_state(state)
+        self._parity[:] = snap.parity
+        self._fields_state = snap.fields
+        self._parity_state = snap.parity
+        self._clones_hash = snap.clones_hash
+        self._world_hash = snap.world_hash
+        if self._bitboards is not None:
+            self._rebuild_bitboards()
+
+    def _jump_state(self):
+        """Capture what _notify_jump needs to describe a change of state
+
+        Returns None if there are no listeners.
+        """
+        if not self._has_listeners():
+            return None
+        return (dict((c, c.position) for c in self._clones),
+                dict((c, p) for p, c in self._crates.iteritems()),
+                [f.activated for f in self._stateful],
+                self._got_goal)
+
+    def _notify_jump(self, old):
+        """Inform listeners of the changes since _jump_state returned old
+
+        The moveables are reported as if they "jumped" to their current
+        positions.
+        """
+        if old is None:
+            return
+        old_clones, old_crates, old_fields, old_goal = old
+
+        for clone in old_clones:
+            if clone not in self._clones:
+                self._emit_event('remove-player-clone', source=clone)
+        for clone in self._clones:
+            if clone not in old_clones:
+                self._emit_event('add-player-clone', source=clone)
+            if old_clones.get(clone) != clone.position:
+                self._emit_event("jump-moveable", source=clone)
+        for pos, crate in self._crates.iteritems():
+            if old_crates.get(crate) != pos:
+                self._emit_event("jump-moveable", source=crate)
+        for field, old in izip(self._stateful, old_fields):
+            if field.activated != old:
+                et = "field-deactivated"
+                if field.activated:
+                    et = "field-activated"
+                self._emit_event(et, source=field)
+        if old_goal != self._got_goal:
+            et = "goal-lost"
+            if self._got_goal:
+                et = "goal-obtained"
+            self._emit_event(et)
+        self._emit_event('end-of-event-sequence')
+
+    def _checkpoint(self, snap=None):
+        """Record a checkpoint for seek if the current turn is due one
+
+        If snap is given, it is recorded as the checkpoint of the
+        current turn regardless of the interval.
+        """
+        interval = self.checkpoint_interval
+        if not interval or (snap is None and self._turn_no % interval):
+            return
+        cps = self._checkpoints
+        jump = len(self._clones) - 1
+        while len(cps) <= jump:
+            cps.append({})
+        if self._turn_no not in cps[jump]:
+            cps[jump][self._turn_no] = snap or self.snapshot()
+
+    def seek(self, jump, turn):
+        """Bring the level into its state at a given turn of a time-jump
+
+        The state is reconstructed from the nearest checkpoint before
+        the turn by replaying the turns after it.  Time-jumps and turns
+        after the current ones (when seek was first called) cannot be
+        reached, but the level can be brought back to the current state
+        with end_review.  Performing any move also ends the review.
+
+        Event listeners are informed of the changes as if the moveables
+        had "jumped" to their new positions.
+
+        @param jump The time-jump (1 is the first; cf. number_of_clones).
+        @param turn The turn in that time-jump (0 is the first; cf. turn).
+        It is clamped to the turns of the time-jump.
+        @return The turn the level was brought to.
+        @raise ValueError If there is no such time-jump or the time-jump
+        has no checkpoint before the turn (e.g. it was played before a
+        call to restore).
+        """
+        live = self._review
+        if live is None:
+            live = (self.snapshot(), self._undo_log, self._redo_log)
+        snap = live[0]
+        if not 1 <= jump <= len(snap.clones):
+            raise ValueError("No such time-jump: %d" % jump)
+        if jump == len(snap.clones) and turn >= snap.turn_no:
+            if self._review is not None:
+                self.end_review()
+            return snap.turn_no
+        cps = {}
+        if jump <= len(self._checkpoints):
+            cps = self._checkpoints[jump - 1]
+        before = [t for t in cps if t <= turn]
+        if not before:
+            raise ValueError("No checkpoint before turn %d of time-jump %d" % (turn, jump))
+
+        old = self._jump_state()
+        self._review = live
+        listeners = (self._listeners, self._dispatch, self._catch_all)
+        self._listeners, self._dispatch, self._catch_all = [], {}, ()
+        try:
+            self._restore_state(cps[max(before)])
+            self._clear_history()
+            timeline = snap.clones[jump - 1][2]
+            while self._turn_no < turn and not self._time_paradox:
+                op = opcodes.SKIP_TURN
+                if self._player_active:
+                    op = timeline[self._turn_no]
+                if ((not self._player_active or op == opcodes.ENTER_TIME_MACHINE)
+                        and self._turn_no >= self._turn_max):
+                    # The next turn would end the time-jump
+                    break
+                if not self._do_action(op):
+                    break
+                self._do_end_of_turn()
+                self._delta = None
+                self._checkpoint()
+            self._clear_history()
+        finally:
+            self._listeners, self._dispatch, self._catch_all = listeners
+        self._notify_jump(old)
+        return self._turn_no
+
+    def end_review(self):
+        """Bring the level back to the state it had before seek was called"""
+        if self._review is None:
+            return
+        snap, undo_log, redo_log = self._review
+        old = self._jump_state()
+        self._restore_state(snap)
+        self._undo_log = undo_log
+        self._redo_log = redo_log
+        self._review = None
+        self._notify_jump(old)
 
     def perform_move(self, action):
-        if self._do_action(action):
+        """Perform an action of the player and end the turn (if needed)
+
+        @param action The action as a name (e.g. "move-up") or an opcode
+        (see chrono.model.opcodes).
+        """
+        op = opcodes.encode(action)
+        if self._review is not None:
+            self.end_review()
+        if op >= opcodes.UNDO_MOVE:
+            if op == opcodes.UNDO_MOVE:
+                self._undo_move()
+            else:
+                self._redo_move()
+            return
+        if self._do_action(op):
+            self._redo_log = []
             self._do_end_of_turn()
-            self._emit_event(GameEvent('end-of-event-sequence'))
+            self._delta = None
+            self._checkpoint()
+            self._emit_event('end-of-event-sequence')
 
     def _time_paradox_event(self, msg):
         self._time_paradox = True
-        e = GameEvent("time-paradox")
-        e.reason = msg
-        self._emit_event(e)
-
-    def _do_action(self, action):
-        act2f = {
-            'move-up': functools.partial(self._move, Direction.NORTH),
-            'move-down': functools.partial(self._move, Direction.SOUTH),
-            'move-left': functools.partial(self._move, Direction.WEST),
-            'move-right': functools.partial(self._move, Direction.EAST),
-            'skip-turn': functools.partial(self._move, Direction.NO_ACT),
-            'reset-time-jump': self._reset_action,
-            'reset-level': self._reset_action,
-            'enter-time-machine': self._enter_time_machine,
-        }
-        return act2f[action](action)
+        self._emit_event("time-paradox", reason=msg)
 
-    def _move(self, direction, action):
+    def _do_action(self, op):
+        if op >= opcodes.RESET_TIME_JUMP:
+            return self._reset_action(op)
+        if op == opcodes.ENTER_TIME_MACHINE:
+            return self._enter_time_machine(op)
+        return self._move(op)
+
+    def _move(self, op):
         if self._time_paradox:
             return False
 
-        if direction != Direction.NO_ACT and not self._player_active:
+        if op != opcodes.SKIP_TURN and not self._player_active:
             return False # ignore movement if the player is not active
         if self._player_active:
-            self._actions.append(action)
+            self._actions.append(op)
         return True
 
-    def _enter_time_machine(self, action):
+    def _enter_time_machine(self, op):
         if self._time_paradox:
             return False
 
@@ -509,52 +1158,78 @@ class Level(BaseLevel):
 
         if not self._player_active:
             return False
-        self._actions.append(action)
+        self._actions.append(op)
         return True
 
     def _do_end_of_turn(self):
+        op = None
+        if self._player_active:
+            op = self._actions[-1]
+        delta = _TurnDelta((self._turn_no, self._turn_max, self._score, self._got_goal,
+                            self._player_active, self._time_paradox),
+                           op, self._active_clones)
+        self._undo_log.append(delta)
+        self._delta = delta
         entered = set()
         left = set()
         unchanged = set()
-        clone_positions = frozenset(c.position for c in self._clones)
+        # Positions where a clone may have ended up on a crate or an
+        # unreachable field during this turn.
+        dirty = set()
+        clone_counts = self._clone_counts
+        step = self._grid.neighbour_position
+        clone_targets = self._clone_targets = {}
+        crate_targets = self._crate_targets = {}
         # Enqueue events (except paradoxes, which we just trigger as soon as we discover them)
         equeue = []
-        def make_event(*a, **kw):
-            equeue.append(functools.partial(self._emit_event, GameEvent(*a, **kw)))
+        def make_event(event_type, **kw):
+            if self._has_listeners(event_type):
+                equeue.append(functools.partial(self._emit_event, event_type, **kw))
 
         for source in self._sources:
+            state = source._get_state()
             if source.on_heartbeat():
+                delta.fields.append((source, state))
+                self._field_changed(source, state)
+                self._fields_state = None
+                dirty.add(source.position)
                 evt = "field-deactivated"
                 if source.activated:
                     evt = "field-activated"
-                make_event(evt, source = source)
-
-        for cno, clone in ifilter(lambda x: self._turn_no < len(x[1]), enumerate(self._clones)):
-            action = clone[self._turn_no]
-            if action == 'enter-time-machine':
+                make_event(evt, source=source)
+
+        turn = self._turn_no
+        # Retire the clones whose time-line has ended
+        acting = [c for c in self._active_clones if turn < len(c)]
+        self._active_clones = acting
+        for clone in acting:
+            d = clone.timeline[turn]
+            action = opcodes.NAMES[d]
+            if d == opcodes.ENTER_TIME_MACHINE:
                 if clone.position != self.start_location.position:
                     self._time_paradox_event("Clone does not make it back to start")
                     return
+                clone_targets.setdefault(clone.position, []).append(clone)
                 make_event(action)
                 continue
-            if action.startswith("move-"):
-                d = Direction.act2dir(action)
+            if d < opcodes.SKIP_TURN:
+                # The opcode of a move is its direction
                 pos = clone.position
                 clone.target = clone.position
-                target = pos.dir_pos(d)
-                crate = self.get_crate_at(target)
+                target = step(pos, d)
+                crate = self._crates.get(target)
                 ct = None
                 act = None
                 succ = True
                 if crate:
-                    ct = target.dir_pos(d)
+                    ct = step(target, d)
                     crate.target = target
-                    if (not self.get_field(ct).can_enter or self.get_crate_at(ct)
-                            or ct in clone_positions):
+                    if (not self._grid.can_enter(ct) or ct in self._crates
+                            or ct in clone_counts):
                         # Crate cannot be moved, push fails.
                         succ = False
 
-                if succ and self.get_field(target).can_enter:
+                if succ and self._grid.can_enter(target):
                     # Do the action if possible
                     if crate:
                         entered.add(ct)
@@ -567,6 +1242,9 @@ class Level(BaseLevel):
                 else:
                     succ = False
                     unchanged.add(pos)
+                clone_targets.setdefault(clone.target, []).append(clone)
+                if crate:
+                    crate_targets.setdefault(crate.target, []).append(crate)
 
                 if succ:
                     if crate:
@@ -580,6 +1258,7 @@ class Level(BaseLevel):
                     make_event(action, source=clone, success=False)
             else:
                 unchanged.add(clone.position)
+                clone_targets.setdefault(clone.position, []).append(clone)
                 make_event(action, source=clone)
 
         if entered or left:
@@ -587,7 +1266,10 @@ class Level(BaseLevel):
             activated = entered - left - unchanged
             is_source = attrgetter("is_activation_source")
             it = chain(deactivated, activated)
-            self._changed_targets(ifilter(is_source, imap(self.get_field, it)))
+            fields = ifilter(None, imap(self._grid.get_special_field, it))
+            changed = self._changed_targets(ifilter(is_source, fields))
+            dirty.update(t.position for t in changed)
+            dirty.update(entered)
 
         try:
             for act in equeue:
@@ -595,60 +1277,68 @@ class Level(BaseLevel):
         except TimeParadoxError:
             return
 
-        for clone in self._clones:
+        clone_counts = self._clone_counts
+        is_bad = lambda p: p in self._crates or not self._grid.can_enter(p)
+        bad = set(p for p in dirty if p in clone_counts and is_bad(p))
+        if bad:
+            # Report the paradox for the first clone (in order of appearance)
+            clone = next(c for c in self._clones if c.position in bad)
             if self.get_crate_at(clone.position):
                 self._time_paradox_event("Clone and crate on the same field %s [Non-Determinism]" \
                                              % str(clone.position))
                 return
-            if not self.get_field(clone.position).can_enter:
-                self._time_paradox_event("Clone is on an unreachable field at end of turn: %s" \
-                                         % str(clone.position))
-                return
+            self._time_paradox_event("Clone is on an unreachable field at end of turn: %s" \
+                                     % str(clone.position))
+            return
 
         if not self._got_goal and self.goal_location.position in entered:
             self._got_goal = True
-            self._emit_event(GameEvent("goal-obtained"))
+            self._emit_event("goal-obtained")
 
         if self._player_active:
             # active moves cost one
             self._score += 1
-            if self._player[-1] == 'enter-time-machine':
+            if self._actions[-1] == opcodes.ENTER_TIME_MACHINE:
                 self._player_active = False
 
         if self._player_active or self._turn_no < self._turn_max:
             self._turn_no += 1
             if self._turn_max < self._turn_no:
                 self._turn_max = self._turn_no
-            self._emit_event(GameEvent("end-of-turn"))
+            self._emit_event("end-of-turn")
         else:
 
             if self._got_goal:
-                self._emit_event(GameEvent("game-complete"))
+                self._emit_event("game-complete")
             else:
                 # cloning cost one
                 self._turn_no = 0
                 self._score += 1
-                self._emit_event(GameEvent("end-of-turn"))
+                self._emit_event("end-of-turn")
 
                 self._player_active = True
-                self._actions = []
+                self._actions = bytearray()
                 self._player = PlayerClone(self.start_location.position, self._actions)
                 self._clones.append(self._player)
+                self._schedule_clones()
+                self._rebuild_clone_index()
+                self._clear_history()
                 self._reset_movables(clones=False)
-                self._emit_event(GameEvent("time-jump"))
-                self._emit_event(GameEvent('add-player-clone', source=self._player))
+                self._rehash()
+                self._emit_event("time-jump")
+                self._emit_event('add-player-clone', source=self._player)
 
-    def _reset_action(self, action):
+    def _reset_action(self, op):
         self._time_paradox = False
         self._reset_movables()
         self._turn_no = 0
-        if action == "reset-time-jump":
+        if op == opcodes.RESET_TIME_JUMP:
             # Remove the latest clone
             self._clones.pop()
-            self._emit_event(GameEvent('remove-player-clone', source=self._player))
-        elif action == "reset-level":
+            self._emit_event('remove-player-clone', source=self._player)
+        elif op == opcodes.RESET_LEVEL:
             for c in self._clones:
-                self._emit_event(GameEvent('remove-player-clone', source=c))
+                self._emit_event('remove-player-clone', source=c)
             self._clones = []
 
         if self._clones:
@@ -662,19 +1352,131 @@ class Level(BaseLevel):
             self._score = 0
 
         if self._got_goal:
-            self._emit_event(GameEvent('goal-lost'))
+            self._emit_event('goal-lost')
             self._got_goal = False
 
         # We always reset by removing a clone (or all clones), so we
         # have insert a clone to replace the removed one (or insert
         # the new "first" clone).
         self._player_active = True
-        self._actions = []
+        self._actions = bytearray()
 
         self._player = PlayerClone(self.start_location.position, self._actions)
         self._clones.append(self._player)
-        self._emit_event(GameEvent('add-player-clone', source=self._player))
-        self._emit_event(GameEvent('end-of-event-sequence'))
+        self._schedule_clones()
+        self._rebuild_clone_index()
+        self._clear_history()
+        self._rehash()
+        del self._checkpoints[len(self._clones) - 1:]
+        self._checkpoint()
+        self._emit_event('add-player-clone', source=self._player)
+        self._emit_event('end-of-event-sequence')
+
+    def _undo_move(self):
+        """Undo the latest action of the player
+
+        Reverts the turns since the "current self" last acted (in its
+        current time-jump) using the changes logged for them.  Event
+        listeners are informed as if the moveables had "jumped" back.
+        """
+        log = self._undo_log
+        if not log:
+            return
+        old_pos = {}
+        old_fields = {}
+        old_goal = self._got_goal
+        while log:
+            delta = log.pop()
+            for clone, _ in delta.clones:
+                old_pos.setdefault(clone, clone.position)
+            for crate, _, _, _ in delta.crates:
+                old_pos.setdefault(crate, crate.position)
+            for field, _ in delta.fields:
+                old_fields.setdefault(field, field.activated)
+            self._revert_turn(delta)
+            self._redo_log.append(delta.op)
+            if delta.op is not None:
+                break
+        if len(self._checkpoints) >= len(self._clones):
+            cps = self._checkpoints[len(self._clones) - 1]
+            for turn in [t for t in cps if t > self._turn_no]:
+                del cps[turn]
+
+        for moveable, pos in old_pos.iteritems():
+            if moveable.position != pos:
+                self._emit_event("jump-moveable", source=moveable)
+        for field, old in old_fields.iteritems():
+            if field.activated != old:
+                et = "field-deactivated"
+                if field.activated:
+                    et = "field-activated"
+                self._emit_event(et, source=field)
+        if old_goal != self._got_goal:
+            et = "goal-lost"
+            if self._got_goal:
+                et = "goal-obtained"
+            self._emit_event(et)
+        self._emit_event('end-of-event-sequence')
+
+    def _redo_move(self):
+        """Redo the latest action undone by _undo_move
+
+        The undone turns are performed again (including the turns where
+        the "current self" waited in the time machine).
+        """
+        redo = self._redo_log
+        if not redo:
+            return
+        while True:
+            op = redo.pop()
+            if op is None:
+                op = opcodes.SKIP_TURN
+            if self._do_action(op):
+                self._do_end_of_turn()
+                self._delta = None
+                self._checkpoint()
+            self._emit_event('end-of-event-sequence')
+            if not redo or redo[-1] is not None:
+                break
+
+    def _revert_turn(self, delta):
+        (self._turn_no, self._turn_max, self._score, self._got_goal,
+         self._player_active, self._time_paradox) = delta.state
+        if delta.op is not None:
+            del self._actions[-1]
+        self._active_clones = delta.active_clones
+        for clone, pos in reversed(delta.clones):
+            self._set_clone_position(clone, pos)
+        crates = self._crates
+        index = self._grid.index
+        crate_keys = self._zobrist.crate
+        bb = self._bitboards
+        for crate, old, new, replaced in reversed(delta.crates):
+            if replaced is None:
+                del crates[new]
+                self._world_hash ^= crate_keys[index(new)]
+                if bb is not None:
+                    bb.crates &= ~(1 << index(new))
+            else:
+                crates[new] = replaced
+            crates[old] = crate
+            crate.position = old
+            self._world_hash ^= crate_keys[index(old)]
+            if bb is not None:
+                bb.crates |= 1 << index(old)
+        for field, state in reversed(delta.fields):
+            old = field._get_state()
+            field._set_state(state)
+            self._field_changed(field, old)
+        parity = self._parity
+        for i in delta.parity:
+            parity[i] ^= 1
+        self._clone_targets = {}
+        self._crate_targets = {}
+        if delta.crates:
+            self._crates_state = None
+        if delta.fields:
+            self._fields_state = None
 
     def _reset_movables(self, clones=True):
         """Reset all movables to their start positions
@@ -686,14 +1488,16 @@ class Level(BaseLevel):
         # De-activate all sources
         self._changed_targets(self._sources, reset=True)
         self._crates = self._crates_orig.copy()
+        self._crates_state = None
         # Move crates back to start...
         for p in self._crates:
             self._crates[p].position = p
-            self._emit_event(GameEvent("jump-moveable", source=self._crates[p]))
+            self._emit_event("jump-moveable", source=self._crates[p])
         if clones:
             for c in self._clones:
                 c.position = self.start_location.position
-                self._emit_event(GameEvent("jump-moveable", source=c))
+                self._emit_event("jump-moveable", source=c)
+            self._rebuild_clone_index()
 
     def check_lvl(self, verbose=False, require_solution=False):
         """Check a level for issues
@@ -703,6 +1507,10 @@ class Level(BaseLevel):
         solution.  Otherwise, a GameError will be raised if there is
         a solution but it does not solve the level or triggers a
         time paradox (or non-determinism).
+
+        Before the solution is replayed, the level is checked by
+        analyse_level.  A GameError is raised if the analysis proves
+        the level cannot be solved (e.g. the goal cannot be reached).
         """
         if verbose:
             print "Checking %s ..." % self.name
@@ -718,6 +1526,10 @@ class Level(BaseLevel):
                     first(field.iter_activation_sources()) is None:
                 print "W: lvl %s: activable (%s) at %s has no sources" \
                       % (self.name, field.symbol, str(field.position))
+        for severity, msg in analyse_level(self):
+            if severity == "E":
+                raise UnsolvableError("E: lvl %s: %s" % (self.name, msg))
+            print "%s: lvl %s: %s" % (severity, self.name, msg)
         if require_solution and solution is None:
             raise UnsolvableError("No solution for %s" % self.name)
         if solution is not None:
@@ -731,15 +1543,16 @@ class Level(BaseLevel):
                 if e.event_type == "game-complete" or e.event_type == "time-paradox":
                     events.append(e)
 
-            self.add_event_listener(event_handler)
+            self.add_event_listener(event_handler, ["time-jump", "game-complete",
+                                                    "time-paradox"])
 
             self.start()
-            for action in solution2actions(solution):
+            for op in solution2opcodes(solution):
                 if events and events[0].event_type == "game-complete":
                     print "W: lvl %s: Solution found in jump %d" \
                         % (self.name, self.number_of_clones)
                     break
-                self.perform_move(action)
+                self.perform_move(op)
                 if events and events[0].event_type == "time-paradox":
                     raise TimeParadoxError("E: lvl %s: Time-paradox in time-jump %d (%s)" \
                         % (self.name, self.number_of_clones, events[0].reason))
@@ -750,7 +1563,7 @@ class Level(BaseLevel):
                 wait_for_timejump = True
                 while not events:
                     # Wait for the current time-jump to finish...
-                    self.perform_move("skip-turn")
+                    self.perform_move(opcodes.SKIP_TURN)
 
             self.remove_event_listener(event_handler)
 
@@ -761,33 +1574,75 @@ class Level(BaseLevel):
         return (c for c in self._clones)
 
     def _changed_targets(self, sources, reset=False):
+        """Update the targets of sources that changed their state
+
+        Returns the targets whose state may have changed.
+        """
+        self._fields_state = None
+        parity = self._parity
+        delta = self._delta
         changed_targets = set()
         change_func = lambda x: x.toggle_activation(self)
         if reset:
             change_func = lambda x: x.reset_to_init_state()
 
-        for f in ifilter(change_func, sources):
-            for t in f.iter_activation_targets():
-                if t in changed_targets:
-                    changed_targets.discard(t)
-                else:
-                    changed_targets.add(t)
+        for f in sources:
+            state = f._get_state()
+            if delta is not None:
+                delta.fields.append((f, state))
+            changed = change_func(f)
+            if f._get_state() != state:
+                self._field_changed(f, state)
+            if not changed:
+                continue
+            targets = self._source_targets[f]
+            changed_targets.symmetric_difference_update(targets)
+            if f.toggles_targets:
+                for i in targets:
+                    parity[i] ^= 1
+                if delta is not None:
+                    delta.parity.extend(targets)
             if f.activated:
-                self._emit_event(GameEvent("field-activated", source=f))
+                self._emit_event("field-activated", source=f)
             else:
-                self._emit_event(GameEvent("field-deactivated", source=f))
-
-        for target in changed_targets:
-            # targets have already been activated/deactivated at this point.
+                self._emit_event("field-deactivated", source=f)
+
+        for i in sorted(changed_targets):
+            target = self._targets[i]
+            state = target._get_state()
+            if delta is not None:
+                delta.fields.append((target, state))
+            target._set_state(bool(self._target_init[i] ^ parity[i]))
+            self._field_changed(target, state)
             et = "field-deactivated"
             if target.activated:
                 et = "field-activated"
-            self._emit_event(GameEvent(et, source=target))
-
+            self._emit_event(et, source=target)
+        return [self._targets[i] for i in changed_targets]
+
+    def _set_clone_position(self, clone, dest_pos):
+        counts = self._clone_counts
+        pos = clone.position
+        if counts[pos] == 1:
+            del counts[pos]
+        else:
+            counts[pos] -= 1
+        counts[dest_pos] = counts.get(dest_pos, 0) + 1
+        clone.position = dest_pos
+        keys = self._zobrist.clone(self._clone_no[clone])
+        index = self._grid.index
+        self._clones_hash ^= keys[index(pos)] ^ keys[index(dest_pos)]
+        bb = self._bitboards
+        if bb is not None:
+            if pos not in counts:
+                bb.clones &= ~(1 << index(pos))
+            bb.clones |= 1 << index(dest_pos)
 
     def _move_clone(self, clone, dest_pos, action):
-        clone.position = dest_pos
-        self._emit_event(GameEvent(action, source=clone))
+        if self._delta is not None:
+            self._delta.clones.append((clone, clone.position))
+        self._set_clone_position(clone, dest_pos)
+        self._emit_event(action, source=clone)
 
         # we cannot check if a crate is on top of the clone here (reliably at least)
         # because the clone may move before it is mow'ed down (rather than moving into
@@ -807,12 +1662,25 @@ class Level(BaseLevel):
             crate = None
         else:
             taken = crate_dest_pos in self._crates
-            crate.position = clone_dest_pos
+            if self._delta is not None:
+                self._delta.crates.append((crate, clone_dest_pos, crate_dest_pos,
+                                           self._crates.get(crate_dest_pos)))
+            crate_keys = self._zobrist.crate
+            old_index = self._grid.index(clone_dest_pos)
+            new_index = self._grid.index(crate_dest_pos)
+            self._world_hash ^= crate_keys[old_index]
+            if not taken:
+                self._world_hash ^= crate_keys[new_index]
+            if self._bitboards is not None:
+                bb = self._bitboards
+                bb.crates = (bb.crates & ~(1 << old_index)) | (1 << new_index)
+            crate.position = crate_dest_pos
             del self._crates[clone_dest_pos]
             self._crates[crate_dest_pos] = crate
+            self._crates_state = None
 
         if crate: # Move the crate if still present
-            self._emit_event(GameEvent(action, source=crate))
+            self._emit_event(action, source=crate)
 
         self._move_clone(clone, clone_dest_pos, action)
 
@@ -820,7 +1688,7 @@ class Level(BaseLevel):
             # The check below is already done, if another clone moved the box for us
             return
 
-        if taken or not self.get_field(clone_dest_pos).can_enter:
+        if taken or not self._grid.can_enter(clone_dest_pos):
             reason = "Two crates colided at %s" % str(clone_dest_pos)
             if not taken:
                 reason = "Crate is on an unreachable field at end of turn: %s" \
@@ -831,6 +1699,8 @@ class Level(BaseLevel):
 class EditableLevel(BaseLevel):
     """A level that can be edited (but not played)"""
 
+    _event_class = EditorEvent
+
     @property
     def name(self):
         return self._name
@@ -842,42 +1712,25 @@ class EditableLevel(BaseLevel):
     def set_metadata_raw(self, field, val):
         self._metadata[field] = val
 
-    def load_level(self, *args, **kwords):
-        super(EditableLevel, self).load_level(*args, **kwords)
-        # Ensure self._lvl is mutable
-        self._lvl = map(list, self._lvl)
-
-    def init_from_level(self, *args, **kwords):
-        super(EditableLevel, self).init_from_level(*args, **kwords)
-        # Ensure self._lvl is mutable
-        self._lvl = map(list, self._lvl)
-
     def new_map(self, width, height, translate=None):
         if width < 3 or height < 3:
             raise ValueError("Width and height must both be at least 3")
 
         crates = {}
-        lvl = []
-        def _new_field(npos, t):
-            if (translate is not None and 0 < npos.x < width - 1 and
-                    0 < npos.y < height - 1):
-                opos = npos - t
-                if (0 < opos.x < self.width - 1) and (0 < opos.y < self.height - 1):
-                    ofield = self.get_field(opos)
-                    ofield._set_position(npos)
+        grid = LevelGrid(width, height)
+        if translate is not None:
+            for x in range(1, width - 1):
+                for y in range(1, height - 1):
+                    npos = Position(x, y)
+                    opos = npos - translate
+                    if not ((0 < opos.x < self.width - 1) and
+                            (0 < opos.y < self.height - 1)):
+                        continue
+                    grid.set_field(npos, self.get_field(opos))
                     crate = self.get_crate_at(opos)
                     if crate:
                         crates[npos] = crate
                         crate.position = npos
-                    return ofield
-            return Wall("+", position=npos)
-
-        for x in range(width):
-            column = []
-            lvl.append(column)
-            for y in range(height):
-                f = _new_field(Position(x, y), translate)
-                column.append(f)
 
         if translate is None:
             # clear unless they are being translated.  In the latter case, they
@@ -892,8 +1745,8 @@ class EditableLevel(BaseLevel):
         self._width = width
         self._height = height
         self._crates = crates
-        self._lvl = lvl
-        self._emit_event(EditorEvent("new-map"))
+        self._grid = grid
+        self._emit_event("new-map")
 
     def perform_change(self, ctype, position, *args, **kwargs):
         if ctype == "toggle-connection":
@@ -902,7 +1755,7 @@ class EditableLevel(BaseLevel):
             self._handle_set_state(position, *args)
         else:
             self._make_field(position, ctype)
-        self._emit_event(EditorEvent("end-of-event-sequence"))
+        self._emit_event("end-of-event-sequence")
 
     def _handle_set_state(self, position, new_state):
         field = self.get_field(position)
@@ -915,7 +1768,7 @@ class EditableLevel(BaseLevel):
                 et = "field-activated"
             else:
                 et = "field-deactivated"
-            self._emit_event(EditorEvent(et, source=field))
+            self._emit_event(et, source=field)
 
     def _handle_connection(self, src_pos, target_pos):
         source = self.get_field(src_pos)
@@ -926,10 +1779,10 @@ class EditableLevel(BaseLevel):
             return
         if source.has_activation_target(target):
             source.remove_activation_target(target)
-            self._emit_event(EditorEvent("field-disconnected", source=source, target=target))
+            self._emit_event("field-disconnected", source=source, target=target)
         else:
             source.add_activation_target(target)
-            self._emit_event(EditorEvent("field-connected", source=source, target=target))
+            self._emit_event("field-connected", source=source, target=target)
 
     def _make_field(self, position, field):
         fields = {
@@ -958,37 +1811,33 @@ class EditableLevel(BaseLevel):
                 old = self.goal_location
             if old is not None:
                 opos = old.position
-                nf = Field(' ')
-                nf._set_position(opos)
-                self._lvl[opos.x][opos.y] = nf
-                self._emit_event(EditorEvent("remove-special-field", source=old))
+                self._grid.set_field(opos, Field(' '))
+                self._emit_event("remove-special-field", source=old)
 
         oldcrate = self.get_crate_at(position)
         if oldcrate:
             del self._crates[position]
-            self._emit_event(EditorEvent("remove-crate", source=oldcrate))
+            self._emit_event("remove-crate", source=oldcrate)
 
         old_field = self.get_field(position)
         if old_field.is_activation_source:
             targets = list(old_field.iter_activation_targets())
             for target in targets:
                 old_field.remove_activation_target(target)
-                self._emit_event(EditorEvent("field-disconnected", source=old_field, target=target))
+                self._emit_event("field-disconnected", source=old_field, target=target)
         if old_field.is_activation_target:
             sources = list(old_field.iter_activation_sources())
             for source in sources:
                 source.remove_activation_target(old_field)
-                self._emit_event(EditorEvent("field-disconnected", source=source, target=old_field))
+                self._emit_event("field-disconnected", source=source, target=old_field)
 
         f = fields[field]()
-        f._set_position(position)
-
-        self._lvl[position.x][position.y] = f
-        self._emit_event(EditorEvent("replace-tile", source=f))
+        self._grid.set_field(position, f)
+        self._emit_event("replace-tile", source=f)
         if field == 'crate':
             c = Crate(position)
             self._crates[position] = c
-            self._emit_event(EditorEvent("add-crate", source=c))
+            self._emit_event("add-crate", source=c)
         if field == "start":
             self._start_location = f
         if field == "goal":
@@ -0,0 +1,247 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Compiled levels
+#
+# A compiled level is a binary file with the tables of a level, so it
+# can be loaded without parsing the text format.  It consists of:
+#
+#  - a header (see _HEADER) with the mtime, size and SHA-1 of the
+#    level file it was compiled from plus the sizes of the tables below
+#  - the cell codes of the grid (width * height bytes)
+#  - the cell indices of the crates (uint32 each)
+#  - the wiring as (source, target) pairs of cell indices (uint32 each)
+#  - the metadata as NUL separated field names and values
+#
+# All numbers are little endian.
+
+from array import array
+import hashlib
+import mmap
+import os
+import StringIO
+import struct
+import sys
+
+from chrono.model.grid import grid_from_cells
+
+# Bump whenever the format changes (old files are then recompiled)
+FORMAT_VERSION = 1
+
+_MAGIC = "CSLV"
+# magic, format, mtime, size, sha1, width, height, crates, wiring, metadata
+_HEADER = struct.Struct("<4sHxxdQ20sHHIII")
+
+def _uint32_array(data):
+    table = array('I')
+    if table.itemsize != 4:
+        table = array('L')
+    table.fromstring(data)
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table
+
+def _uint32_bytes(values):
+    table = _uint32_array("")
+    table.extend(values)
+    if sys.byteorder != "little":
+        table.byteswap()
+    return table.tostring()
+
+def compile_level(level, mtime, size, digest):
+    """Create the compiled form of a level
+
+    @param level The level (a BaseLevel in its initial state).
+    @param mtime The mtime of the level file.
+    @param size The size of the level file.
+    @param digest The SHA-1 digest of the content of the level file.
+    @return The compiled level as a str.
+    """
+    grid = level.grid
+    cells = str(grid.cells)
+    crates = [grid.index(c.position) for c in level.iter_crates()]
+    wiring = []
+    for field in grid.iter_special_fields():
+        if field.is_activation_source:
+            source = grid.index(field.position)
+            for target in field.iter_activation_targets():
+                wiring.append(source)
+                wiring.append(grid.index(target.position))
+    metadata = []
+    for name, value in sorted(level._metadata.iteritems()):
+        metadata.append(name)
+        metadata.append(value)
+    metadata = "\0".join(metadata)
+    header = _HEADER.pack(_MAGIC, FORMAT_VERSION, mtime, size, digest,
+                          grid.width, grid.height, len(crates),
+                          len(wiring) // 2, len(metadata))
+    return "".join((header, cells, _uint32_bytes(crates),
+                    _uint32_bytes(wiring), metadata))
+
+def _read_header(data):
+    """Returns the header of a compiled level or None if it is invalid"""
+    if len(data) < _HEADER.size:
+        return None
+    header = _HEADER.unpack_from(data)
+    if header[0] != _MAGIC or header[1] != FORMAT_VERSION:
+        return None
+    width, height, ncrates, nwiring, metalen = header[5:]
+    expected = _HEADER.size + width * height + 4 * ncrates + 8 * nwiring + metalen
+    if len(data) != expected:
+        return None
+    return header
+
+def load_compiled(level, name, data):
+    """Init a level from its compiled form
+
+    @param level The level to init (a BaseLevel).
+    @param name The name of the level.
+    @param data The compiled level (a str or an mmap).
+    """
+    header = _read_header(data)
+    if header is None:
+        raise IOError("Bad compiled level (%s)" % name)
+    width, height, ncrates, nwiring, metalen = header[5:]
+    offset = _HEADER.size
+    cells = bytearray(data[offset:offset + width * height])
+    offset += width * height
+    crate_cells = _uint32_array(data[offset:offset + 4 * ncrates])
+    offset += 4 * ncrates
+    wiring = _uint32_array(data[offset:offset + 8 * nwiring])
+    offset += 8 * nwiring
+    metadata = {}
+    if metalen:
+        fields = data[offset:offset + metalen].split("\0")
+        metadata = dict(zip(fields[::2], fields[1::2]))
+    grid, _ = grid_from_cells(width, height, cells)
+    crates = [grid.position(idx) for idx in crate_cells]
+    pairs = zip(wiring[::2], wiring[1::2])
+    level.init_from_tables(name, grid, crates, pairs, metadata)
+
+class LevelCache(object):
+    """Cache of compiled levels
+
+    Levels are loaded from their compiled form if it is up to date.
+    Otherwise, the level file is parsed and compiled (and the compiled
+    form is written to the cache).
+
+    A compiled level is up to date if the mtime and the size of the
+    level file are unchanged or, failing that, the SHA-1 of its content
+    is unchanged.  Compiled levels are loaded via mmap.
+
+    @param cache_dir The directory of the compiled levels.  If None,
+    the compiled level is stored next to the level file (with ".lvc"
+    appended to its name).
+    """
+
+    def __init__(self, cache_dir=None):
+        self._cache_dir = cache_dir
+        if cache_dir is not None and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def cache_file(self, fname):
+        """Returns the name of the compiled form of a level file"""
+        if self._cache_dir is None:
+            return fname + ".lvc"
+        path = os.path.abspath(fname)
+        base = os.path.basename(fname)
+        return os.path.join(self._cache_dir, "%s-%s.lvc"
+                            % (base, hashlib.sha1(path).hexdigest()[:16]))
+
+    def load_level(self, level, fname, content=None):
+        """Init a level from a level file (using its compiled form if possible)
+
+        @param level The level to init (a BaseLevel).
+        @param fname The path to the level file.  It is also used as name
+        of the level.
+        @param content The content of the level file or None.  If given,
+        the compiled form is validated by the SHA-1 of content (rather
+        than the mtime of the file).
+
+        Raises IOError in case of errors (like BaseLevel.load_level).
+        """
+        st = None
+        if content is None:
+            st = os.stat(fname)
+        cfile = self.cache_file(fname)
+        try:
+            with open(cfile, "rb") as fd:
+                data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            # Missing (or empty) compiled form
+            data = None
+        if data is not None:
+            try:
+                header = _read_header(data)
+                if header is not None and self._up_to_date(fname, header, st, content):
+                    load_compiled(level, fname, data)
+                    if st is not None and st.st_mtime != header[2]:
+                        # Unchanged content (e.g. touched); refresh the
+                        # mtime so the next load need not hash the file
+                        self._write(cfile, compile_level(level, st.st_mtime,
+                                                         st.st_size, header[4]))
+                    return level
+            finally:
+                data.close()
+
+        if content is None:
+            with open(fname, "rb") as fd:
+                content = fd.read()
+        level.load_level(fname, StringIO.StringIO(content))
+        # If content was given, fname need not exist (e.g. a level in a
+        # campaign bundle); such levels are only validated by their hash
+        mtime = 0
+        if st is not None:
+            mtime = st.st_mtime
+        digest = hashlib.sha1(content).digest()
+        self._write(cfile, compile_level(level, mtime, len(content), digest))
+        return level
+
+    def _up_to_date(self, fname, header, st, content):
+        mtime, size, digest = header[2:5]
+        if content is None:
+            if st.st_mtime == mtime and st.st_size == size:
+                return True
+            if st.st_size != size:
+                return False
+            with open(fname, "rb") as fd:
+                content = fd.read()
+        return hashlib.sha1(content).digest() == digest
+
+    def _write(self, cfile, data):
+        tmp = "%s.%d.tmp" % (cfile, os.getpid())
+        try:
+            with open(tmp, "wb") as fd:
+                fd.write(data)
+            os.rename(tmp, cfile)
+        except (IOError, OSError):
+            # The cache is only an optimization
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
@@ -26,14 +26,17 @@ NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+from itertools import imap
+
 from chrono.model.direction import Direction
+from chrono.model import opcodes
 from chrono.model.position import Position
 
 class Moveable(object):
 
     def __init__(self, position, is_player, is_crate):
         self._is_player = is_player
-        self._is_box = is_crate
+        self._is_crate = is_crate
         self.position = position
         self._target = None
 
@@ -57,6 +60,13 @@ class Moveable(object):
         self._target = value
 
 class PlayerClone(Moveable):
+    """A clone of the player and its time-line
+
+    Indexing and iterating the clone gives its actions by name (e.g.
+    "move-up").  The time-line is stored as opcodes (see
+    chrono.model.opcodes), which are available via the timeline
+    property.
+    """
 
     def __init__(self, position, actions):
         super(PlayerClone, self).__init__(position, True, False)
@@ -66,10 +76,27 @@ class PlayerClone(Moveable):
         return len(self._actions)
 
     def __getitem__(self, i):
-        return self._actions[i]
+        if isinstance(i, slice):
+            return map(opcodes.decode, self._actions[i])
+        return opcodes.decode(self._actions[i])
 
     def __iter__(self):
-        return iter(self._actions)
+        return self.iter_actions()
+
+    @property
+    def timeline(self):
+        """The time-line of the clone as a bytearray of opcodes
+
+        See chrono.model.opcodes.  The bytearray must not be modified.
+        """
+        return self._actions
+
+    def iter_actions(self):
+        """Iterate over the actions of the clone by name (e.g. "move-up")"""
+        return imap(opcodes.decode, self._actions)
+
+    def _set_actions(self, actions):
+        self._actions = actions
 
 class Crate(Moveable):
 
@@ -0,0 +1,108 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+from chrono.model.direction import Direction
+
+# Compact (integer) encoding of the actions of the player.  The
+# opcodes of the moves are the directions they move in, so an opcode
+# below SKIP_TURN can be used directly as a Direction.  All opcodes
+# fit in a byte and the time-line of a clone is stored as a bytearray
+# of opcodes.  The action names (e.g. "move-up") remain the public
+# API; encode and decode translate between the two.
+
+MOVE_UP = Direction.NORTH
+MOVE_RIGHT = Direction.EAST
+MOVE_DOWN = Direction.SOUTH
+MOVE_LEFT = Direction.WEST
+SKIP_TURN = Direction.NO_ACT
+ENTER_TIME_MACHINE = 5
+RESET_TIME_JUMP = 6
+RESET_LEVEL = 7
+UNDO_MOVE = 8
+REDO_MOVE = 9
+
+# Name of each opcode (indexed by opcode).  The names of the actions
+# a clone can do are also the event types emitted for them.
+NAMES = (
+    'move-up',
+    'move-right',
+    'move-down',
+    'move-left',
+    'skip-turn',
+    'enter-time-machine',
+    'reset-time-jump',
+    'reset-level',
+    'undo-move',
+    'redo-move',
+)
+
+# The letter used for an opcode in the "solution format" (indexed by
+# opcode).  The reset, undo and redo opcodes cannot appear in a solution.
+LETTERS = 'NESWHT'
+
+_ENCODE = dict((name, op) for op, name in enumerate(NAMES))
+_ENCODE.update((op, op) for op in xrange(len(NAMES)))
+
+_LETTER2OPCODE = dict((l, op) for op, l in enumerate(LETTERS))
+
+def encode(action):
+    """Determine the opcode of an action
+
+    @param action The action as a name (e.g. "move-up") or an opcode.
+    @return The opcode of the action.
+    @raise KeyError If action is not a known action.
+    """
+    return _ENCODE[action]
+
+def decode(op):
+    """Determine the name of an opcode
+
+    @param op The opcode.
+    @return The name of the action (e.g. "move-up").
+    """
+    return NAMES[op]
+
+def is_move(op):
+    """Determine if an opcode moves the clone
+
+    @param op The opcode.
+    @return True if op is MOVE_UP, MOVE_RIGHT, MOVE_DOWN or MOVE_LEFT.
+    """
+    return op < SKIP_TURN
+
+def letter2opcode(letter):
+    """Determine the opcode of a letter in the "solution format"
+
+    @param letter The letter (e.g. "N").
+    @return The opcode of the letter.
+    @raise ValueError If letter is not a valid letter.
+    """
+    try:
+        return _LETTER2OPCODE[letter]
+    except KeyError:
+        raise ValueError("Unknown command %s" % letter)
@@ -0,0 +1,143 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+# Random 64-bit keys for Zobrist hashing of the state of a level.  The
+# hash of a state is the XOR of the keys of its parts (e.g. "clone 2 is
+# on cell 17"), so it can be updated in constant time when one part
+# changes.  The keys are derived from a fixed seed, so the hash of a
+# state is the same in every run of the game.
+#
+# As the keys only depend on the seed, the key tables are shared by
+# all levels (and all threads) and only ever grow; a table is extended
+# when a level needs more keys than have been generated so far.
+
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_MASK = (1 << 64) - 1
+
+# The kinds of keys (used as part of the seed of each key)
+_CRATE = 1
+_CLONE = 2
+_FIELD = 3
+_TURN = 4
+_FLAG = 5
+
+def _mix(x):
+    """Scramble an integer into a 64-bit key (the splitmix64 finalizer)"""
+    x = (x + 0x9E3779B97F4A7C15) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+def _make_keys(kind, number, count, start=0):
+    """Returns the keys start..count-1 of a given kind and number
+
+    With NumPy, the keys are computed for the entire range at once.
+    """
+    base = (kind << 56) | (number << 32)
+    if numpy is None:
+        return [_mix(base | i) for i in xrange(start, count)]
+    u64 = numpy.uint64
+    x = numpy.arange(start, count, dtype=numpy.uint64) | u64(base)
+    x += u64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> u64(30))) * u64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> u64(27))) * u64(0x94D049BB133111EB)
+    return (x ^ (x >> u64(31))).tolist()
+
+# Key tables generated so far, indexed by (kind, number)
+_KEYS = {}
+_KEYS_LOCK = threading.Lock()
+
+def _keys(kind, number, count):
+    """Returns a shared table with (at least) the first count keys of
+    a given kind and number
+
+    The returned list must not be modified.
+    """
+    keys = _KEYS.get((kind, number))
+    if keys is not None and len(keys) >= count:
+        return keys
+    with _KEYS_LOCK:
+        keys = _KEYS.setdefault((kind, number), [])
+        if len(keys) < count:
+            # Only append, so readers holding the list are not affected
+            keys.extend(_make_keys(kind, number, count, start=len(keys)))
+    return keys
+
+class ZobristKeys(object):
+    """The keys for hashing the states of a level
+
+    @param cells The number of cells in the grid of the level.
+    @param fields The number of fields with a dynamic state.
+    """
+
+    def __init__(self, cells, fields):
+        self._cells = cells
+        self.crate = _keys(_CRATE, 0, cells)
+        self._clones = []
+        # Four keys per field (see field)
+        self._fields = _keys(_FIELD, 0, fields * 4)
+        self._turns = _keys(_TURN, 0, 0)
+        self.goal_obtained, self.player_active, self.time_paradox = \
+            _keys(_FLAG, 0, 3)[:3]
+
+    def clone(self, number):
+        """The keys of the cells for a given clone
+
+        @param number The index of the clone (in order of appearance).
+        @return A list of keys indexed by cell index.
+        """
+        clones = self._clones
+        while len(clones) <= number:
+            clones.append(_keys(_CLONE, len(clones), self._cells))
+        return clones[number]
+
+    def field(self, number, state):
+        """The key of a state of a field
+
+        @param number The index of the field.
+        @param state The state of the field (see Field._get_state); a
+        boolean or a pair of booleans.
+        """
+        if state.__class__ is tuple:
+            code = state[0] + 2 * state[1]
+        else:
+            code = int(state)
+        return self._fields[number * 4 + code]
+
+    def turn(self, turn):
+        """The key of a turn number"""
+        turns = self._turns
+        if len(turns) <= turn:
+            turns = self._turns = _keys(_TURN, 0, turn + 1)
+        return turns[turn]
@@ -0,0 +1,167 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import collections
+import threading
+
+from chrono.model.level import EditableLevel, Level
+from chrono.view.background import background_size, make_background
+
+# A background rendered ahead of time (see make_background).  It is
+# only valid for the tileset and grid setting it was rendered with.
+PreparedBackground = collections.namedtuple('PreparedBackground', [
+    'tileset', 'grid', 'image', 'overlays'
+])
+
+class LoadedLevel(object):
+    """A level file loaded as an editable and a playable level
+
+    If the file could not be loaded, edit_level and level are None
+    and error is the IOError.  If the level cannot be played (e.g. it
+    has no start location), level is None and error is the exception.
+
+    @param name The name of the level.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.edit_level = None
+        self.level = None
+        self.error = None
+        self.background = None
+
+def read_level(fname, infd=None):
+    """Load a level file as a LoadedLevel
+
+    @param fname The name of the level (see BaseLevel.load_level).
+    @param infd A file descriptor with the level or None.
+    """
+    loaded = LoadedLevel(fname)
+    edit_level = EditableLevel()
+    try:
+        edit_level.load_level(fname, infd=infd)
+    except IOError as e:
+        loaded.error = e
+        return loaded
+    loaded.edit_level = edit_level
+    level = Level()
+    try:
+        level.init_from_level(edit_level)
+    except (IOError, ValueError) as e:
+        loaded.error = e
+        return loaded
+    loaded.level = level
+    return loaded
+
+def _fits(level, max_size):
+    if max_size is None:
+        return True
+    width, height = background_size(level)
+    return width <= max_size[0] and height <= max_size[1]
+
+class LevelPrefetcher(object):
+    """Load the next level of a campaign on a worker thread
+
+    The worker loads the level (see read_level) and renders its
+    background, so switching to it later does not have to wait for
+    either.  Only one level is prefetched at a time; starting a new
+    prefetch discards the previous one.
+
+    @param map_cache The TileCache used for backgrounds.
+    """
+
+    def __init__(self, map_cache):
+        self._map_cache = map_cache
+        self._key = None
+        self._thread = None
+        self._result = None
+
+    def prefetch(self, campaign, index, tileset, grid=False, max_size=None):
+        """Start loading level index of campaign
+
+        @param campaign The JikibanCampaign.
+        @param index The index of the level in the campaign.
+        @param tileset The tileset for the background.
+        @param grid Whether the background has grid lines.
+        @param max_size The (width, height) in pixels of the largest
+        background to render or None for no limit.  Larger backgrounds
+        are left to the GameWindow (which renders them in chunks).
+        """
+        self.cancel()
+        # Load the tiles here, so the worker only reads the cache
+        self._map_cache[tileset]
+        key = (campaign, index)
+        result = []
+        thread = threading.Thread(target=self._load,
+                                  args=(result, campaign, index, tileset, grid,
+                                        max_size))
+        thread.daemon = True
+        self._key = key
+        self._thread = thread
+        self._result = result
+        thread.start()
+
+    def _load(self, result, campaign, index, tileset, grid, max_size):
+        name = campaign[index]
+        try:
+            loaded = read_level(name, infd=campaign.open_level(index))
+        except IOError as e:
+            loaded = LoadedLevel(name)
+            loaded.error = e
+        if loaded.level is not None and _fits(loaded.level, max_size):
+            image, overlays = make_background(loaded.level, tileset=tileset,
+                                              map_cache=self._map_cache,
+                                              grid=grid)
+            loaded.background = PreparedBackground(tileset, grid, image, overlays)
+        result.append(loaded)
+
+    def take(self, campaign, index):
+        """Returns the prefetched level (a LoadedLevel)
+
+        Waits for the worker if it is still loading the level.  Returns
+        None if level index of campaign was not being prefetched.
+        """
+        if self._key != (campaign, index):
+            return None
+        self._thread.join()
+        result = self._result
+        self.cancel()
+        if not result:
+            # The worker died
+            return None
+        return result[0]
+
+    def cancel(self):
+        """Discard the prefetched level (if any)
+
+        A worker that is still running is not stopped; its result is
+        just ignored.
+        """
+        self._key = None
+        self._thread = None
+        self._result = None
@@ -0,0 +1,263 @@
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import heapq
+import itertools
+
+from chrono.model import opcodes
+from chrono.model.deadlock import DeadlockTables
+from chrono.model.level import Level, actions2solution, solution2opcodes
+
+_MOVES = (opcodes.MOVE_UP, opcodes.MOVE_RIGHT, opcodes.MOVE_DOWN,
+          opcodes.MOVE_LEFT, opcodes.SKIP_TURN)
+
+def format_solution(timelines):
+    """Format the timelines of a solution as the "Solution" metadata field
+
+    @param timelines A sequence of action sequences (one per clone).
+    @return The solution as it would be written in a level file.
+    """
+    return "\n " + "\n .\n ".join(actions2solution(t) for t in timelines)
+
+def solution_score(solution):
+    """Determine the score of a solution
+
+    Every action costs one and so does every time-jump after the first.
+
+    @param solution The solution in the "solution format".
+    @return The score of the solution.
+    """
+    ops = list(solution2opcodes(solution, naive_replay=False))
+    jumps = sum(1 for op in ops if op == opcodes.ENTER_TIME_MACHINE)
+    return len(ops) + max(jumps, 1) - 1
+
+class Solver(object):
+    """Search for a low-score solution of a level
+
+    The solver does a uniform cost search over the states of the
+    level, where every action by the "current self" costs one (like
+    the score of the level).  Turns where the "current self" waits
+    inside the time machine are skipped automatically (they are free).
+
+    The state of a level is determined by the clone, crate and field
+    states plus the time-lines of the earlier clones (as these decide
+    what happens in the rest of the time-jump).  Unless it is the last
+    time-jump, the path of the "current self" also matters, since it
+    will be replayed in the following time-jumps.  Tracking the full
+    path is too expensive, so two paths are considered the same if
+    they changed the fields and crates in the same way (turn by turn).
+    Solutions relying on a clone blocking another clone (rather than
+    holding a button) may therefore be missed, but any solution found
+    is valid.  States that have been seen before are discarded (the
+    crates and fields are compared by Level.world_hash).
+
+    In the last possible time-jump, states where frozen crates (see
+    DeadlockTables) block every clone from reaching the goal location
+    are discarded as well.
+
+    The search is first done with one clone, then with two clones
+    (etc.).  Once a solution has been found, searches with more clones
+    only look for solutions with a lower score.
+
+    The search is bounded by max_clones, max_turns (per time-jump) and
+    max_states (states visited in total).  The solution found is only
+    known to have the minimal score (within max_clones and max_turns)
+    if is_minimal is True after solve.  It is not if the max_states
+    limit was reached or if paths of the "current self" were merged by
+    the approximation above.
+    """
+
+    def __init__(self, level, max_clones=3, max_turns=40, max_states=200000):
+        self._level = Level()
+        self._level.init_from_level(level)
+        self._level.checkpoint_interval = 0
+        self.max_clones = max_clones
+        self.max_turns = max_turns
+        self.max_states = max_states
+        self.states_visited = 0
+        self.state_limit_reached = False
+        self.paths_merged = False
+        self._outcome = None
+        self._level.add_event_listener(self._game_event, ["game-complete",
+                                                          "time-paradox"])
+        self._level.start()
+        self._level.enable_bitboards()
+        self._initial = self._level.snapshot()
+        self._deadlocks = DeadlockTables(self._level)
+
+    def _game_event(self, e):
+        self._outcome = e.event_type
+
+    def _perform(self, action):
+        """Perform an action and skip turns until the player can act again"""
+        lvl = self._level
+        lvl.perform_move(action)
+        while self._outcome is None and lvl.active_player is None:
+            lvl.perform_move(opcodes.SKIP_TURN)
+
+    def _state_key(self, trace):
+        lvl = self._level
+        clones = list(lvl.iter_clones())
+        earlier = tuple(str(c.timeline) for c in clones[:-1])
+        # Without earlier clones, the turn does not affect the rest of
+        # the time-jump.
+        turn = lvl.turn[0] if earlier else None
+        return (earlier, turn, lvl.goal_obtained,
+                tuple(c.position for c in clones),
+                lvl.world_hash,
+                trace)
+
+    def _trace(self, trace, clones, max_clones):
+        """Extend the trace of the "current self" with the current turn"""
+        lvl = self._level
+        if lvl.number_of_clones != clones or clones == max_clones:
+            # New time-jump (the "current self" has not done anything
+            # yet) or the last possible time-jump (no one will replay
+            # the path of the "current self").
+            return 0
+        self.paths_merged = True
+        return hash((trace, lvl.world_hash))
+
+    def _deadlocked(self, crates_before):
+        """Determine if frozen crates keep the goal location out of reach
+
+        Only crates that moved (compared to crates_before) are checked
+        for being frozen, as the previous state was not deadlocked.
+        """
+        lvl = self._level
+        if lvl.goal_obtained:
+            return False
+        moved = lvl.bitboards.crates & ~crates_before
+        if not moved:
+            return False
+        grid = lvl.grid
+        tables = self._deadlocks
+        crates = set(grid.index(c.position) for c in lvl.iter_crates())
+        if not any(moved >> idx & 1 and tables.is_frozen(idx, crates)
+                   for idx in crates):
+            return False
+        sources = [grid.index(c.position) for c in lvl.iter_clones()]
+        sources.append(grid.index(lvl.start_location.position))
+        return not tables.goal_reachable(sources, tables.frozen_crates(crates))
+
+    def _candidate_actions(self, max_clones):
+        lvl = self._level
+        player = lvl.active_player
+        if lvl.turn[0] < self.max_turns:
+            # In the last possible time-jump, nobody replays the path of
+            # the "current self", so a move that fails is the same as
+            # skipping the turn.
+            last = lvl.number_of_clones == max_clones
+            bb = lvl.bitboards
+            idx = lvl.grid.index(player.position)
+            for action in _MOVES:
+                if (last and action != opcodes.SKIP_TURN
+                        and not bb.can_move(idx, action)):
+                    continue
+                yield action
+        if player.position == lvl.start_location.position:
+            yield opcodes.ENTER_TIME_MACHINE
+
+    @property
+    def is_minimal(self):
+        """Whether the last solve was exhaustive (see the class docstring)"""
+        return not (self.state_limit_reached or self.paths_merged)
+
+    def solve(self):
+        """Search for a solution
+
+        @return A list of time-lines (one list of opcodes per clone) or
+        None if no solution was found within the bounds of the solver.
+        """
+        self.states_visited = 0
+        self.state_limit_reached = False
+        self.paths_merged = False
+        best = None
+        for max_clones in xrange(1, self.max_clones + 1):
+            bound = None
+            if best is not None:
+                bound = best[0]
+            solution = self._search(max_clones, bound)
+            if solution is not None:
+                best = solution
+            if self.state_limit_reached:
+                break
+        if best is None:
+            return None
+        return best[1]
+
+    def _search(self, max_clones, bound):
+        """Search for a solution with at most max_clones clones
+
+        If bound is not None, only solutions with a lower score are
+        considered.  Returns a tuple of the score and the time-lines of
+        the solution or None if there is no such solution.
+        """
+        lvl = self._level
+        lvl.restore(self._initial)
+        counter = itertools.count()
+        queue = [(0, next(counter), self._initial, 0, None)]
+        seen = set([self._state_key(0)])
+        self.states_visited += 1
+
+        while queue:
+            score, _, snap, trace, solution = heapq.heappop(queue)
+            if bound is not None and score >= bound:
+                return None
+            if solution is not None:
+                return (score, solution)
+            lvl.restore(snap)
+            clones = lvl.number_of_clones
+            for action in list(self._candidate_actions(max_clones)):
+                lvl.restore(snap)
+                crates = lvl.bitboards.crates
+                self._outcome = None
+                self._perform(action)
+                if self._outcome == "time-paradox":
+                    continue
+                if self._outcome == "game-complete":
+                    solution = [list(c.timeline) for c in lvl.iter_clones()]
+                    heapq.heappush(queue, (lvl.score, next(counter), None, None, solution))
+                    continue
+                if lvl.number_of_clones > max_clones:
+                    continue
+                if (lvl.number_of_clones == max_clones
+                        and self._deadlocked(crates)):
+                    continue
+                child_trace = self._trace(trace, clones, max_clones)
+                key = self._state_key(child_trace)
+                if key in seen:
+                    continue
+                seen.add(key)
+                self.states_visited += 1
+                if self.states_visited >= self.max_states:
+                    self.state_limit_reached = True
+                    return None
+                heapq.heappush(queue, (lvl.score, next(counter), lvl.snapshot(),
+                                       child_trace, None))
+        return None
@@ -0,0 +1,170 @@
+"""
+Taken (with modification) from:
+  https://bitbucket.org/thesheep/qq/src/1090d7e5537f/qq.py?at=default
+
+@copyright: 2008, 2009 Radomir Dopieralski <qq@sheep.art.pl>
+@license: BSD
+                           BSD LICENSE
+
+Copyright (c) 2008, 2009, Radomir Dopieralski
+All rights reserved. 
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+
+import pygame
+
+class _Page(object):
+    """A surface of the atlas that images are packed into (in shelves)"""
+
+    def __init__(self, surface):
+        self.surface = surface
+        self.width, self.height = surface.get_size()
+        # Shelves as [y, height, used width]
+        self.shelves = []
+
+    def place(self, width, height):
+        """Find room for an image; returns its position or None"""
+        for shelf in self.shelves:
+            y, shelf_height, used = shelf
+            if height <= shelf_height and used + width <= self.width:
+                shelf[2] += width
+                return (used, y)
+        y = 0
+        if self.shelves:
+            y = self.shelves[-1][0] + self.shelves[-1][1]
+        if y + height > self.height or width > self.width:
+            return None
+        self.shelves.append([y, height, width])
+        return (0, y)
+
+class TextureAtlas(object):
+    """Decode each image once and pack them into a few surfaces
+
+    Images are converted to the display format (like convert or
+    convert_alpha) and copied into shared "pages" (surfaces of
+    page_size x page_size pixels).  The images are handed out as
+    subsurfaces of the pages with the alpha and colorkey of the
+    converted image.  Images converted with convert_alpha and with
+    convert are put on different pages (as they differ in pixel
+    format).
+
+    The images must not be modified, as they share their pages with
+    other images.
+
+    @param page_size The width and height of the pages.  Larger images
+    get a page of their own.
+    @param loader The function used to decode an image file (defaults
+    to pygame.image.load).
+    """
+
+    def __init__(self, page_size=256, loader=None):
+        self.page_size = page_size
+        if loader is None:
+            loader = pygame.image.load
+        self.loader = loader
+        self._images = {}
+        # convert_alpha -> list of _Page
+        self._pages = {}
+
+    def load(self, path, convert_alpha=True):
+        """Returns the image stored in a file (as a subsurface of a page)
+
+        @param path The path to the image.
+        @param convert_alpha Whether the image is converted with
+        convert_alpha (otherwise convert is used).
+        """
+        key = (path, convert_alpha)
+        image = self._images.get(key)
+        if image is None:
+            image = self._images[key] = self._add(self.loader(path),
+                                                  convert_alpha)
+        return image
+
+    def _add(self, image, convert_alpha):
+        if convert_alpha:
+            image = image.convert_alpha()
+        else:
+            image = image.convert()
+        width, height = image.get_size()
+        pages = self._pages.setdefault(convert_alpha, [])
+        for page in pages:
+            pos = page.place(width, height)
+            if pos is not None:
+                break
+        else:
+            size = (max(width, self.page_size), max(height, self.page_size))
+            page = _Page(self._new_surface(size, convert_alpha))
+            pages.append(page)
+            pos = page.place(width, height)
+        alpha = image.get_alpha()
+        colorkey = image.get_colorkey()
+        # Copy the pixels (including the alpha channel) rather than
+        # blending them onto the page
+        image.set_alpha(None)
+        image.set_colorkey(None)
+        page.surface.blit(image, pos)
+        view = page.surface.subsurface(pygame.Rect(pos, (width, height)))
+        view.set_alpha(alpha)
+        view.set_colorkey(colorkey)
+        return view
+
+    def _new_surface(self, size, convert_alpha):
+        if convert_alpha:
+            return pygame.Surface(size, pygame.SRCALPHA, 32).convert_alpha()
+        return pygame.Surface(size).convert()
+
+    @property
+    def image_count(self):
+        """The number of images in the atlas"""
+        return len(self._images)
+
+    @property
+    def page_count(self):
+        """The number of pages of the atlas"""
+        return sum(len(pages) for pages in self._pages.itervalues())
+
+    @property
+    def memory_usage(self):
+        """The number of bytes used by the pixels of the pages"""
+        total = 0
+        for pages in self._pages.itervalues():
+            for page in pages:
+                surface = page.surface
+                total += surface.get_pitch() * surface.get_height()
+        return total
+
+_ATLAS = None
+
+def get_atlas():
+    """Returns the process-wide TextureAtlas
+
+    The display mode must have been set before images are loaded.
+    """
+    global _ATLAS
+    if _ATLAS is None:
+        _ATLAS = TextureAtlas()
+    return _ATLAS
@@ -35,101 +35,350 @@ NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
+import hashlib
+import threading
+
 import pygame
-import operator
-import functools
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 from chrono.model.direction import Direction
+from chrono.model.grid import WALL
 from chrono.view.tile_cache import TileCache
 
 from chrono.view.translation import MAP_TILE_WIDTH, MAP_TILE_HEIGHT
 
+# The tile of a wall only depends on which of its neighbours are walls
+# (cells outside the grid count as walls).  The neighbours are packed
+# into a 6-bit mask, which indexes _WALL_TILES.  Code _FLOOR (i.e. one
+# past the masks) is used for all cells that are not walls.
+_N, _E, _S, _W, _SE, _SW = 1, 2, 4, 8, 16, 32
+_FLOOR = 64
+
+def _wall_tiles(mask):
+    """Returns the tile and the overlay (or None) of a wall"""
+    east = mask & _E
+    west = mask & _W
+    if not mask & _S:
+        if west and east:
+            tile = 1, 2
+        elif east:
+            tile = 0, 2
+        elif west:
+            tile = 2, 2
+        else:
+            tile = 3, 2
+    else:
+        if mask & _SE and mask & _SW:
+            # Walls at SW, S and SE
+            tile = 1, 1
+        elif mask & _SE:
+            # Walls at S and SE
+            tile = 0, 1
+        elif mask & _SW:
+            # Walls at SW and S
+            tile = 2, 1
+        else:
+            tile = 3, 1
+    over = None
+    # Add overlays if the wall may be obscuring something
+    if not mask & _N:
+        if east and west:
+            over = 1, 0
+        elif east:
+            over = 0, 0
+        elif west:
+            over = 2, 0
+        else:
+            over = 3, 0
+    return tile, over
+
+_WALL_TILES = [_wall_tiles(mask) for mask in xrange(_FLOOR)]
+_WALL_TILES.append(((0, 3), None))
+
+# Rendered backgrounds keyed by the wall layout, the tileset and whether
+# they have grid lines (see make_background).
+_BACKGROUNDS = {}
+_BACKGROUND_ORDER = []
+_BACKGROUND_LOCK = threading.Lock()
+MAX_CACHED_BACKGROUNDS = 16
+
+def _cell_code(lgrid, idx):
+    """Returns the tile code (see _WALL_TILES) of a cell"""
+    wall = lgrid.is_wall_index
+    if not wall(idx):
+        return _FLOOR
+    # Neighbours of -1 (i.e. outside the grid) are outside the grid as well
+    nb = lambda i, d: lgrid.neighbour(i, d) if i >= 0 else -1
+    south = nb(idx, Direction.SOUTH)
+    code = 0
+    if wall(nb(idx, Direction.NORTH)):
+        code |= _N
+    if wall(nb(idx, Direction.EAST)):
+        code |= _E
+    if wall(south):
+        code |= _S
+    if wall(nb(idx, Direction.WEST)):
+        code |= _W
+    if wall(nb(south, Direction.EAST)):
+        code |= _SE
+    if wall(nb(south, Direction.WEST)):
+        code |= _SW
+    return code
+
+def _cell_codes(lgrid):
+    """Returns the tile codes of all cells of the grid (in row-major order)
+
+    With NumPy, the wall masks are computed for the entire grid at once
+    by comparing the grid against shifted copies of itself.
+    """
+    if numpy is None:
+        return [_cell_code(lgrid, idx)
+                for idx in xrange(lgrid.width * lgrid.height)]
+    width, height = lgrid.width, lgrid.height
+    cells = numpy.frombuffer(bytes(lgrid.cells), dtype=numpy.uint8)
+    # Pad the grid with a border of walls
+    walls = numpy.ones((height + 2, width + 2), dtype=numpy.uint8)
+    walls[1:-1, 1:-1] = cells.reshape(height, width) == WALL
+    codes = (walls[:-2, 1:-1] * _N | walls[1:-1, 2:] * _E |
+             walls[2:, 1:-1] * _S | walls[1:-1, :-2] * _W |
+             walls[2:, 2:] * _SE | walls[2:, :-2] * _SW)
+    codes[walls[1:-1, 1:-1] == 0] = _FLOOR
+    return codes.ravel().tolist()
+
+def _draw_grid_lines(image, level):
+    rect = image.get_rect()
+    for x in range(MAP_TILE_WIDTH, level.width * MAP_TILE_WIDTH, MAP_TILE_WIDTH):
+        pygame.draw.line(image, (0, 0, 0), (x, 0), (x, rect.h))
+    for y in range(MAP_TILE_HEIGHT, level.height * MAP_TILE_HEIGHT, MAP_TILE_HEIGHT):
+        pygame.draw.line(image, (0, 0, 0), (0, y), (rect.w, y))
+
 def update_background(tiles, background, level, field, fixup=False, grid=False, overlays=None):
     pos = field.position
     if overlays is None:
         overlays = {}
-    def wall(pos):
-        if 0 <= pos.x < level.width and 0 <= pos.y < level.height:
-            return level.get_field(pos).is_wall
-        return True
-
-    wall_dir2 = lambda pos, d: wall(pos.dir_pos(d))
-    wall_dir = functools.partial(wall_dir2, pos)
-
-    if wall(pos):
-        tile = 3, 3
-        # Draw different tiles depending on neighbourhood
-        if not wall_dir(Direction.SOUTH):
-            if wall_dir(Direction.WEST) and wall_dir(Direction.EAST):
-                tile = 1, 2
-            elif wall_dir(Direction.EAST):
-                tile = 0, 2
-            elif wall_dir(Direction.WEST):
-                tile = 2, 2
-            else:
-                tile = 3, 2
-        else:
-            south = pos.dir_pos(Direction.SOUTH)
-            if wall_dir2(south, Direction.EAST) and wall_dir2(south, Direction.WEST):
-                # Walls at SW, S and SE
-                tile = 1, 1
-            elif wall_dir2(south, Direction.EAST):
-                # Walls at S and SE
-                tile = 0, 1
-            elif wall_dir2(south, Direction.WEST):
-                # Walls at SW and S
-                tile = 2, 1
-            else:
-                tile = 3, 1
-        # Add overlays if the wall may be obscuring something
-        if not wall_dir(Direction.NORTH):
-            if wall_dir(Direction.EAST) and wall_dir(Direction.WEST):
-                over = 1, 0
-            elif wall_dir(Direction.EAST):
-                over = 0, 0
-            elif wall_dir(Direction.WEST):
-                over = 2, 0
-            else:
-                over = 3, 0
-            overlays[pos] = tiles[over[0]][over[1]]
-    else:
-        tile = 0, 3
+    lgrid = level.grid
+    idx = lgrid.index(pos)
+
+    tile, over = _WALL_TILES[_cell_code(lgrid, idx)]
+    if over is not None:
+        overlays[pos] = tiles[over[0]][over[1]]
     tile_image = tiles[tile[0]][tile[1]]
     background.blit(tile_image,
                     (field.x * MAP_TILE_WIDTH, field.y * MAP_TILE_HEIGHT))
 
     if fixup:
         for d in (Direction.NORTH, Direction.SOUTH, Direction.WEST, Direction.EAST):
-            ff = level.get_field(field.position.dir_pos(d))
+            nidx = lgrid.neighbour(idx, d)
+            if nidx < 0:
+                continue
+            ff = level.get_field(lgrid.position(nidx))
             update_background(tiles, background, level, ff, fixup=False, overlays=overlays)
-        rect = background.get_rect()
-        for x in range(MAP_TILE_WIDTH, level.width * MAP_TILE_WIDTH, MAP_TILE_WIDTH):
-            pygame.draw.line(background, (0, 0, 0), (x, 0), (x, rect.h))
-        for y in range(MAP_TILE_HEIGHT, level.height * MAP_TILE_HEIGHT, MAP_TILE_HEIGHT):
-            pygame.draw.line(background, (0, 0, 0), (0, y), (rect.w, y))
+        _draw_grid_lines(background, level)
 
     return overlays
 
+def _render_background(tiles, lgrid, codes, grid):
+    width = lgrid.width
+    image = pygame.Surface((width * MAP_TILE_WIDTH,
+                            lgrid.height * MAP_TILE_HEIGHT))
+    overlays = {}
+    images = [(tiles[t[0]][t[1]], o and tiles[o[0]][o[1]])
+              for t, o in _WALL_TILES]
+    blit = image.blit
+    for idx, code in enumerate(codes):
+        tile_image, over = images[code]
+        x, y = idx % width, idx // width
+        blit(tile_image, (x * MAP_TILE_WIDTH, y * MAP_TILE_HEIGHT))
+        if over is not None:
+            overlays[lgrid.position(idx)] = over
+
+    if grid:
+        _draw_grid_lines(image, lgrid)
+
+    return image, overlays
+
 def make_background(level, tileset=None, map_cache=None, grid=False):
+    """Render the static background (walls and floor) of a level
+
+    The background only depends on the walls of the level, so it is
+    cached per wall layout and tileset.  Re-entering a level (or
+    switching back to a tileset) therefore reuses the rendered image.
+
+    @param level The level.
+    @param tileset The name of the tileset (defaults to "tileset").
+    @param map_cache The TileCache to load the tileset from.
+    @param grid Whether to draw grid lines on the background.
+    @return A tuple of the image and a dict mapping positions to the
+    overlay tiles of walls.  The image is shared with the cache and
+    must not be modified.
+    """
     if tileset is None:
         tileset = "tileset" # default is literally "tileset"
     if map_cache is None:
-        self._map_cache = TileCache(MAP_TILE_WIDTH, MAP_TILE_HEIGHT)
+        map_cache = TileCache(MAP_TILE_WIDTH, MAP_TILE_HEIGHT)
     tiles = map_cache[tileset]
-    gates = {}
-    image = pygame.Surface((level.width*MAP_TILE_WIDTH,
-                            level.height*MAP_TILE_HEIGHT))
-    overlays = {}
-    ub = functools.partial(update_background, tiles, image, level, overlays=overlays, grid=False)
+    lgrid = level.grid
+    codes = _cell_codes(lgrid)
+    layout = hashlib.sha1(bytearray(codes)).digest()
+    key = (lgrid.width, lgrid.height, layout, tileset, bool(grid))
 
-    for field in level.iter_fields():
-        ub(field)
+    with _BACKGROUND_LOCK:
+        cached = _BACKGROUNDS.get(key)
+        if cached is not None and cached[0] is tiles:
+            _BACKGROUND_ORDER.remove(key)
+            _BACKGROUND_ORDER.append(key)
+            return cached[1], dict(cached[2])
 
-    if grid:
-        rect = image.get_rect()
-        for x in range(MAP_TILE_WIDTH, level.width * MAP_TILE_WIDTH, MAP_TILE_WIDTH):
-            pygame.draw.line(image, (0, 0, 0), (x, 0), (x, rect.h))
-        for y in range(MAP_TILE_HEIGHT, level.height * MAP_TILE_HEIGHT, MAP_TILE_HEIGHT):
-            pygame.draw.line(image, (0, 0, 0), (0, y), (rect.w, y))
+    image, overlays = _render_background(tiles, lgrid, codes, grid)
 
-    return image, overlays
+    with _BACKGROUND_LOCK:
+        if key in _BACKGROUNDS:
+            _BACKGROUND_ORDER.remove(key)
+        _BACKGROUNDS[key] = (tiles, image, overlays)
+        _BACKGROUND_ORDER.append(key)
+        while len(_BACKGROUND_ORDER) > MAX_CACHED_BACKGROUNDS:
+            del _BACKGROUNDS[_BACKGROUND_ORDER.pop(0)]
+
+    return image, dict(overlays)
+
+def background_size(level):
+    """Returns the size (in pixels) of the background of a level"""
+    return (level.width * MAP_TILE_WIDTH, level.height * MAP_TILE_HEIGHT)
+
+class ChunkedBackground(object):
+    """Background of a (large) level rendered in chunks on demand
+
+    Rendering the background of a large level as a single surface takes
+    a lot of memory (and time).  Instead the level is split into chunks
+    of chunk_size fields, which are rendered the first time they become
+    visible in a viewport (see draw).  At most max_chunks chunks are
+    kept; the least recently drawn ones are evicted first.
+
+    @param level The level.
+    @param tiles The tiles of the tileset (as returned by a TileCache).
+    @param grid Whether to draw grid lines on the background.
+    @param chunk_size The (width, height) of a chunk in fields.
+    @param max_chunks The maximum number of rendered chunks kept.
+    """
+
+    def __init__(self, level, tiles, grid=False, chunk_size=(16, 16),
+                 max_chunks=16):
+        self._level = level
+        self._tiles = tiles
+        self._grid = grid
+        self._chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self._codes = _cell_codes(level.grid)
+        self._images = [(tiles[t[0]][t[1]], o and tiles[o[0]][o[1]])
+                        for t, o in _WALL_TILES]
+        # Rendered chunks (surface and overlays) and their keys, the
+        # most recently drawn last.
+        self._chunks = {}
+        self._order = []
+
+    @property
+    def chunk_count(self):
+        """The number of chunks currently rendered"""
+        return len(self._chunks)
+
+    def _render_chunk(self, key):
+        cx, cy = key
+        cw, ch = self._chunk_size
+        lgrid = self._level.grid
+        width = lgrid.width
+        x0, y0 = cx * cw, cy * ch
+        x1, y1 = min(x0 + cw, width), min(y0 + ch, lgrid.height)
+        image = pygame.Surface(((x1 - x0) * MAP_TILE_WIDTH,
+                                (y1 - y0) * MAP_TILE_HEIGHT))
+        overlays = {}
+        codes = self._codes
+        images = self._images
+        blit = image.blit
+        for y in xrange(y0, y1):
+            for x in xrange(x0, x1):
+                idx = y * width + x
+                tile_image, over = images[codes[idx]]
+                blit(tile_image, ((x - x0) * MAP_TILE_WIDTH,
+                                  (y - y0) * MAP_TILE_HEIGHT))
+                if over is not None:
+                    overlays[lgrid.position(idx)] = over
+
+        if self._grid:
+            # Only the lines between fields (none at the edges of the map)
+            rect = image.get_rect()
+            for x in xrange(max(x0, 1), x1):
+                gx = (x - x0) * MAP_TILE_WIDTH
+                pygame.draw.line(image, (0, 0, 0), (gx, 0), (gx, rect.h))
+            for y in xrange(max(y0, 1), y1):
+                gy = (y - y0) * MAP_TILE_HEIGHT
+                pygame.draw.line(image, (0, 0, 0), (0, gy), (rect.w, gy))
+
+        return image, overlays
+
+    def _chunk(self, key):
+        chunk = self._chunks.get(key)
+        if chunk is None:
+            chunk = self._chunks[key] = self._render_chunk(key)
+        else:
+            self._order.remove(key)
+        self._order.append(key)
+        return chunk
+
+    def draw(self, target, viewport):
+        """Draw the part of the background inside the viewport
+
+        Chunks are rendered as needed, and chunks are evicted (least
+        recently drawn first) once there are more than max_chunks of
+        them.
+
+        @param target The surface to draw on.  The top left corner of
+        the viewport is drawn at (0, 0).
+        @param viewport A pygame.Rect of the visible part of the
+        background (in pixels).
+        @return A dict mapping positions to the overlay tiles of the
+        walls in the drawn chunks.
+        """
+        cw = self._chunk_size[0] * MAP_TILE_WIDTH
+        ch = self._chunk_size[1] * MAP_TILE_HEIGHT
+        width, height = background_size(self._level)
+        view = viewport.clip(pygame.Rect(0, 0, width, height))
+        overlays = {}
+        if not view.w or not view.h:
+            return overlays
+        keys = [(cx, cy)
+                for cy in xrange(view.top // ch, (view.bottom - 1) // ch + 1)
+                for cx in xrange(view.left // cw, (view.right - 1) // cw + 1)]
+        for key in keys:
+            image, chunk_overlays = self._chunk(key)
+            target.blit(image, (key[0] * cw - viewport.x,
+                                key[1] * ch - viewport.y))
+            overlays.update(chunk_overlays)
+        # Never evict the chunks just drawn
+        limit = max(self.max_chunks, len(keys))
+        while len(self._order) > limit:
+            del self._chunks[self._order.pop(0)]
+        return overlays
+
+    def update_field(self, pos):
+        """Update the background after the field at pos has changed
+
+        The tiles of the field and the fields next to it are updated
+        and the chunks containing them are rendered again when drawn.
+        """
+        lgrid = self._level.grid
+        cw, ch = self._chunk_size
+        # The fields whose tile depends on the field at pos
+        for dx, dy in ((0, 0), (0, 1), (-1, 0), (1, 0), (0, -1),
+                       (-1, -1), (1, -1)):
+            x, y = pos[0] + dx, pos[1] + dy
+            if not (0 <= x < lgrid.width and 0 <= y < lgrid.height):
+                continue
+            idx = y * lgrid.width + x
+            self._codes[idx] = _cell_code(lgrid, idx)
+            key = (x // cw, y // ch)
+            if self._chunks.pop(key, None) is not None:
+                self._order.remove(key)
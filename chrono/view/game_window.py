@@ -46,7 +46,9 @@ from pgu import gui
 from chrono.model.direction import Direction
 from chrono.model.position import Position
 
-from chrono.view.background import make_background, update_background
+from chrono.view.background import (
+        make_background, update_background, background_size, ChunkedBackground
+    )
 from chrono.view.sprites import (
         SortedUpdates, Sprite, PlayerSprite, Shadow, MoveableSprite,
         TimeSprite
@@ -61,15 +63,25 @@ def _kill_sprite(container, key):
         del container[key]
 
 class GameWindow(gui.Widget):
-    """The main game object."""
+    """The main game object.
+
+    The window shows the part of the level inside its viewport (the
+    size of the window, at the top left corner of the map).  Levels
+    that fit inside the viewport get a background rendered as a single
+    (cached) surface.  The backgrounds of larger levels are rendered
+    in chunks (see ChunkedBackground), so only the visible part of the
+    map is ever rendered.
+    """
 
     def __init__(self, resource_dirs=None, **params):
-        params['width'] = 450
-        params['height'] = 300
+        width = params.setdefault('width', 450)
+        height = params.setdefault('height', 300)
         params['focusable'] = False
         super(GameWindow, self).__init__(**params)
-        self.surface = pygame.Surface((450, 300))
+        self.surface = pygame.Surface((width, height))
         self.surface.fill((0, 0, 0))
+        self.viewport = pygame.Rect(0, 0, width, height)
+        self._background = None
         self.grid = False
         self.shadows = pygame.sprite.RenderUpdates()
         self.hilights = pygame.sprite.RenderUpdates()
@@ -91,7 +103,6 @@ class GameWindow(gui.Widget):
         self._gates = {}
         self._crates = {}
         self.active_animation = False
-        self._gevent_seq = []
         self._gevent_queue = Queue.Queue()
         self.level = None
         self._event_handler = {
@@ -134,42 +145,61 @@ class GameWindow(gui.Widget):
         self._tileset = ntile
         self.repaint()
 
-    def use_level(self, level, grid=None):
-        """Set the level as the current one."""
+    def use_level(self, level, grid=None, background=None):
+        """Set the level as the current one.
+
+        If background is a PreparedBackground (see chrono.prefetch) of
+        the level, it is used instead of rendering the background.
+        """
 
         if grid is not None:
             self.grid = grid
+        if self.level is not None and self.level is not level:
+            self.level.remove_batch_listener(self._new_events)
         self.level = level
-        self._gevent_seq = []
         self._gevent_queue = Queue.Queue()
-        level.add_event_listener(self._new_event)
-        self._new_map()
+        level.add_batch_listener(self._new_events, self._event_handler.keys())
+        self._new_map(background=background)
 
-    def _new_event(self, e):
-        self._gevent_seq.append(e)
-        if e.event_type == "end-of-event-sequence":
-            # flush
-            self._gevent_queue.put(self._gevent_seq)
-            self._gevent_seq = []
+    def _new_events(self, seq):
+        if seq:
+            self._gevent_queue.put(seq)
 
-    def _make_background(self, tileset=None):
+    def _make_background(self, tileset=None, prepared=None):
         self.overlays = pygame.sprite.RenderUpdates()
 
         # Render the level map
         if tileset is None:
             tileset = self._tileset
 
-        background, overlays = make_background(self.level,
-                                               map_cache=self.map_cache,
-                                               tileset=tileset,
-                                               grid=self.grid)
-
+        self._background = None
         self.surface.fill((0, 0, 0))
-        self.surface.blit(background, (0,0))
+        if (prepared is not None and prepared.tileset == tileset and
+                prepared.grid == self.grid):
+            background, overlays = prepared.image, prepared.overlays
+        elif self._fits_viewport(self.level):
+            background, overlays = make_background(self.level,
+                                                   map_cache=self.map_cache,
+                                                   tileset=tileset,
+                                                   grid=self.grid)
+        else:
+            self._background = ChunkedBackground(self.level,
+                                                 self.map_cache[tileset],
+                                                 grid=self.grid)
+            overlays = self._background.draw(self.surface, self.viewport)
+            background = None
+
+        if background is not None:
+            self.surface.blit(background, (0,0))
 
         self._add_overlay(overlays)
 
-    def _new_map(self, *args):
+    def _fits_viewport(self, level):
+        """Determine if the background of level fits inside the viewport"""
+        width, height = background_size(level)
+        return width <= self.viewport.w and height <= self.viewport.h
+
+    def _new_map(self, *args, **kwords):
         self.shadows = pygame.sprite.RenderUpdates()
         self.sprites = SortedUpdates()
         self.animated_background = pygame.sprite.RenderUpdates()
@@ -182,16 +212,17 @@ class GameWindow(gui.Widget):
         level = self.level
 
         # Render the level map
-        self._make_background()
-
-        for field in level.iter_fields():
-            # Crates looks best in 32x32, gates and buttons in 24x16
-            #   - if its "on top of" a field 32x32 usually looks best.
-            #   - if it is (like) a field, 24x16 is usually better
-            # - use sprite_cache and map_cache accordingly.
-            crate = level.get_crate_at(field.position)
-            if crate:
-                self._add_crate(crate)
+        self._make_background(prepared=kwords.get("background"))
+
+        # Crates looks best in 32x32, gates and buttons in 24x16
+        #   - if its "on top of" a field 32x32 usually looks best.
+        #   - if it is (like) a field, 24x16 is usually better
+        # - use sprite_cache and map_cache accordingly.
+        for crate in level.iter_crates():
+            self._add_crate(crate)
+        # Plain walls and fields are part of the background, so only
+        # the other fields need sprites.
+        for field in level.grid.iter_special_fields():
             self._init_field(field)
 
         try:
@@ -251,6 +282,7 @@ class GameWindow(gui.Widget):
     def _add_overlay(self, overlays):
         # Add the overlays for the level map
         for (x, y), image in overlays.iteritems():
+            _kill_sprite(self.overlays_sprites, Position(x, y))
             overlay = pygame.sprite.Sprite(self.overlays)
             overlay.image = image.subsurface(0, 0, MAP_TILE_WIDTH, MAP_TILE_HEIGHT/2)
             overlay.rect = image.get_rect().move(Position(x*MAP_TILE_WIDTH,
@@ -274,9 +306,13 @@ class GameWindow(gui.Widget):
             dpos = f.position.dir_pos(d)
             _kill_sprite(self.overlays_sprites, dpos)
 
-        # FIXME: remove old overlay
-        overlays = update_background(self.map_cache[self._tileset], self.surface, self.level, f,
-                                     fixup=True, grid=self.grid)
+        if self._background is not None:
+            self._background.update_field(f.position)
+            overlays = self._background.draw(self.surface, self.viewport)
+        else:
+            # FIXME: remove old overlay
+            overlays = update_background(self.map_cache[self._tileset], self.surface, self.level, f,
+                                         fixup=True, grid=self.grid)
         self._add_overlay(overlays)
         ani_bg = None
 
@@ -355,8 +391,6 @@ class GameWindow(gui.Widget):
             seq = self._gevent_queue.get_nowait()
             print "Event seq [%s]" % (", ".join(x.event_type for x in seq))
             for e in seq:
-                if e.event_type not in self._event_handler:
-                    continue
                 self._event_handler[e.event_type](e)
             self.active_animation = True
         except Queue.Empty:
@@ -35,19 +35,26 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import os
-import pygame
+
+from chrono.view.atlas import get_atlas
 
 class TileCache(object):
-    """Load the tilesets lazily into global cache"""
+    """Load the tilesets lazily into global cache
+
+    The images are loaded via a TextureAtlas (by default the
+    process-wide one), so every image is only decoded once no matter
+    how many TileCaches use it.
+    """
 
     def __init__(self,  width=32, height=None, resource_dirs=None,
-                 convert_alpha=True):
+                 convert_alpha=True, atlas=None):
         self.resource_dirs = resource_dirs
         if resource_dirs is None:
             self.resource_dirs = [os.getcwd()]
         self.width = width
         self.height = height or width
         self.convert_alpha = convert_alpha
+        self.atlas = atlas
         self.cache = {}
 
     def __getitem__(self, filename):
@@ -67,11 +74,10 @@ class TileCache(object):
     def _load_tile_table(self, filename, width, height):
         """Load an image and split it into tiles."""
 
-        temp = pygame.image.load(filename)
-        if self.convert_alpha:
-            image = temp.convert_alpha()
-        else:
-            image = temp.convert()
+        atlas = self.atlas
+        if atlas is None:
+            atlas = get_atlas()
+        image = atlas.load(filename, convert_alpha=self.convert_alpha)
         image_width, image_height = image.get_size()
         tile_table = []
         for tile_x in range(0, image_width/width):
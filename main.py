@@ -51,19 +51,24 @@ if 1:
 from pgu import gui
 
 from chrono.model.campaign import JikibanCampaign
+from chrono.model import opcodes
 from chrono.model.position import Position
-from chrono.model.level import EditableLevel, Level, solution2actions
+from chrono.model.level import EditableLevel, Level, solution2opcodes
 from chrono.ctrl.controller import PlayKeyController
 from chrono.ctrl.mouse_ctrl import EditMouseController, MouseController
 from chrono.ctrl.diag import (MessageDialog, SelectFileDialog, NewLevelDialog,
                               simple_file_filter)
 from chrono.ctrl.pgu_diag import EnhancedFileDialog
+from chrono.audio import AudioPlayer
+from chrono.decoded_cache import DecodedCache
+from chrono.prefetch import LevelPrefetcher, read_level
+from chrono.view.atlas import get_atlas
 from chrono.view.game_window import GameWindow
 from chrono.view.tile_icon import TileIcon
 from chrono.view.tutorial import Tutorial
 
 LVL_FILTER = simple_file_filter(lambda x: x.endswith(".txt"))
-LSF_FILTER = simple_file_filter(lambda x: x.endswith(".lsf"))
+LSF_FILTER = simple_file_filter(lambda x: x.endswith(".lsf") or x.endswith(".lsb"))
 
 class ScoreTracker(gui.Label):
 
@@ -177,6 +182,20 @@ def make_game_ctrls(app, width, height):
 
     from_left += reset_lvl.rect.w + spacer
 
+    undo = gui.Button("Undo")
+    undo.connect(gui.CLICK, app.undo_move, None)
+    c.add(undo, from_left, from_top)
+    undo.rect.w, undo.rect.h = undo.resize()
+
+    from_left += undo.rect.w + spacer
+
+    redo = gui.Button("Redo")
+    redo.connect(gui.CLICK, app.redo_move, None)
+    c.add(redo, from_left, from_top)
+    redo.rect.w, redo.rect.h = redo.resize()
+
+    from_left += redo.rect.w + spacer
+
     hint = gui.Button("Show hint")
     hint.connect(gui.CLICK, app.show_hint)
     c.add(hint, from_left, from_top)
@@ -214,7 +233,7 @@ def make_game_ctrls(app, width, height):
     def _toggle_sounds():
         app.muted = mcb.value
         if app.muted:
-            pygame.mixer.stop()
+            app.audio.stop()
         else:
             app.play_sound("background", loops = -1, volume = 1.0/3)
 
@@ -256,8 +275,10 @@ class Application(gui.Desktop):
 
         self.widget = CTRLWidget(width=640,height=490)
 
-        self._audio = {}
+        self.audio = None
         self.muted = False
+        # Optional DecodedCache for sounds (and images, see main)
+        self.decoded_cache = None
 
         self._mode = "play"
         self._game_state = "stopped"
@@ -279,6 +300,7 @@ class Application(gui.Desktop):
         self.play_mctrl = MouseController(self.game_window)
         self.edit_ctrl = None
         self.edit_mctrl = EditMouseController(self.game_window)
+        self.prefetcher = LevelPrefetcher(self.game_window.map_cache)
 
         level_dir  = os.path.join(ROOT_DIR, "levels")
         self.open_campaign_d = EnhancedFileDialog(title_txt="Start Campaign",
@@ -308,9 +330,13 @@ class Application(gui.Desktop):
 
         pygame.key.set_repeat() # Disable repeats
 
-        self._audio["time-paradox"]  = pygame.mixer.Sound("sound/123921__silencer1337__machinefail.wav")
-        self._audio["game-complete"] = pygame.mixer.Sound("sound/90138__pierrecartoons1979__win1.wav")
-        self._audio["background"] = pygame.mixer.Sound("sound/POL-sand-and-water-short_repeat.wav")
+        load_sound = None
+        if self.decoded_cache is not None:
+            load_sound = self.decoded_cache.load_sound
+        self.audio = AudioPlayer(load_sound=load_sound)
+        self.audio.add_effect("time-paradox", "sound/123921__silencer1337__machinefail.wav")
+        self.audio.add_effect("game-complete", "sound/90138__pierrecartoons1979__win1.wav")
+        self.audio.add_music("background", "sound/POL-sand-and-water-short_repeat.wav")
 
         self.play_sound("background", loops = -1, volume = 1.0/3)
 
@@ -404,13 +430,25 @@ class Application(gui.Desktop):
         if self.auto_play:
             return
         if self.level:
-            self.level.perform_move('reset-time-jump')
+            self.level.perform_move(opcodes.RESET_TIME_JUMP)
 
     def reset_level(self, *args):
         if self.auto_play:
             return
         if self.level:
-            self.level.perform_move('reset-level')
+            self.level.perform_move(opcodes.RESET_LEVEL)
+
+    def undo_move(self, *args):
+        if self.auto_play:
+            return
+        if self.level:
+            self.level.perform_move(opcodes.UNDO_MOVE)
+
+    def redo_move(self, *args):
+        if self.auto_play:
+            return
+        if self.level:
+            self.level.perform_move(opcodes.REDO_MOVE)
 
     def action_open_lvl(self):
         self.load_level(self.open_lvl_d.value)
@@ -419,7 +457,16 @@ class Application(gui.Desktop):
         if self.campaign_lvl_no != -1:
             self.campaign_lvl_no += 1
             if self.campaign_lvl_no < len(self.campaign):
-                self.load_level(self.campaign[self.campaign_lvl_no])
+                self.load_campaign_level(self.campaign_lvl_no)
+
+    def _listen_for_game_events(self, level):
+        event_types = set(["time-jump", "end-of-turn", "game-complete", "time-paradox"])
+        for fname in level.iter_metadata_fields():
+            if fname.startswith("tutorial-"):
+                event_types.add(fname[len("tutorial-"):])
+        level.add_event_listener(self.game_event, event_types)
+        sc = functools.partial(self.score.update_score, level)
+        level.add_event_listener(sc, ["end-of-event-sequence"])
 
     def game_event(self, ge):
         event_text = self.level.get_metadata_raw("tutorial-%s" % ge.event_type)
@@ -450,7 +497,7 @@ class Application(gui.Desktop):
         if self.level.active_player or self.auto_play:
             return
         self.fcounter = 0
-        self.auto_play = itertools.repeat("skip-turn")
+        self.auto_play = itertools.repeat(opcodes.SKIP_TURN)
 
     def toggle_auto_finish(self, *args):
         nvalue = self.skip_till_time_jump.value
@@ -459,7 +506,7 @@ class Application(gui.Desktop):
         if nvalue and self.mode == "play" and not self.auto_play and self.level:
             if self.level.turn[0] > 0 and not self.level.active_player:
                 self.fcounter = 0
-                self.auto_play = itertools.repeat("skip-turn")
+                self.auto_play = itertools.repeat(opcodes.SKIP_TURN)
 
     def load_campaign_action(self):
         return self.load_campaign(self.open_campaign_d.value)
@@ -479,25 +526,41 @@ class Application(gui.Desktop):
 
         self.campaign = campaign
         self.campaign_lvl_no = 0
-        self.load_level(campaign[0])
-
-    def load_level(self, fname):
+        self.load_campaign_level(0)
+
+    def load_campaign_level(self, index):
+        campaign = self.campaign
+        loaded = self.prefetcher.take(campaign, index)
+        if loaded is None:
+            try:
+                infd = campaign.open_level(index)
+            except IOError as e:
+                self._show_error(str(e), "Cannot load map")
+                return
+            loaded = read_level(campaign[index], infd=infd)
+        self._use_level(loaded)
+        if index + 1 < len(campaign):
+            # Load the next level while this one is being played
+            self.prefetcher.prefetch(campaign, index + 1,
+                                     self.game_window.tileset,
+                                     grid=(self.mode != "play"),
+                                     max_size=self.game_window.viewport.size)
+
+    def load_level(self, fname, infd=None):
+        self.prefetcher.cancel()
+        self._use_level(read_level(fname, infd=infd))
+
+    def _use_level(self, loaded):
         self.auto_play = None
-        edit_level = EditableLevel()
-        level = Level()
-        try:
-            edit_level.load_level(fname)
-        except IOError as e:
-            self._show_error(str(e), "Cannot load map")
+        edit_level = loaded.edit_level
+        level = loaded.level
+        if edit_level is None:
+            self._show_error(str(loaded.error), "Cannot load map")
             return
 
-        try:
-            level.init_from_level(edit_level)
-        except (IOError, ValueError) as e:
-            if self.mode != "edit":
-                self._show_error(str(e), "Cannot play map!")
-                return
-            level = None
+        if level is None and self.mode != "edit":
+            self._show_error(str(loaded.error), "Cannot play map!")
+            return
 
         self._game_state = "stopped"
         self.edit_level = edit_level
@@ -507,10 +570,8 @@ class Application(gui.Desktop):
 
         if level:
             self.level = level
-            self.level.add_event_listener(self.game_event)
             self.play_ctrl.level = level
             self.play_mctrl.level = level
-            sc = functools.partial(self.score.update_score, self.level)
 
         lvl = edit_level
         grid = True
@@ -518,9 +579,12 @@ class Application(gui.Desktop):
             lvl = level
             grid = False
 
-        self.game_window.use_level(lvl, grid=grid)
+        background = None
+        if self.mode == "play":
+            background = loaded.background
+        self.game_window.use_level(lvl, grid=grid, background=background)
         if level:
-            level.add_event_listener(sc)
+            self._listen_for_game_events(level)
             # must be done after game_window.use_level
             level.start()
             self._game_state = "running"
@@ -542,7 +606,7 @@ class Application(gui.Desktop):
             return
         self.reset_level()
         print "Playing solution"
-        self.auto_play = solution2actions(sol)
+        self.auto_play = solution2opcodes(sol)
         self.fcounter = 0
 
     def new_map(self):
@@ -640,23 +704,20 @@ class Application(gui.Desktop):
         self._game_state = "stopped"
         self._finish_event = None
         self.level = level
-        self.level.add_event_listener(self.game_event)
         self.play_ctrl.level = self.level
         self.game_window.use_level(self.level, grid=False)
-        sc = functools.partial(self.score.update_score, self.level)
-        self.level.add_event_listener(sc)
+        self._listen_for_game_events(self.level)
         self._game_state = "running"
         self.level.start()
 
     def play_sound(self, sound, loops = 0, volume = 1):
-        if sound not in self._audio:
+        if sound not in self.audio:
             # Emit this even if we are muted (for error finding)
             print "W: Unknown sound %s" % sound
             return
         if self.muted:
             return
-        self._audio[sound].set_volume(volume)
-        self._audio[sound].play(loops)
+        self.audio.play(sound, loops=loops, volume=volume)
 
     def open_tutorial(self, *args):
         t = Tutorial()
@@ -690,7 +751,7 @@ class Application(gui.Desktop):
             if not self.fcounter:
                 if self.auto_play and self.mode == "play":
                     act = next(self.auto_play, None)
-                    if not act:
+                    if act is None:
                         self.auto_play = None
                     else:
                         self.level.perform_move(act)
@@ -715,12 +776,19 @@ if __name__ == "__main__":
                         help="Disable sounds")
     parser.add_argument('--editor', action="store_true", default=False,
                         help="Start up in editor mode")
+    parser.add_argument('--decoded-cache', action="store", default=None,
+                        dest="decoded_cache",
+                        help="Keep decoded images and sounds in this directory"
+                        + " (speeds up the next start)")
 
     parser.add_argument('level', action="store", default=None, nargs="?",
                         help="The level or campaign to play")
     args = parser.parse_args()
 
     app.muted = args.muted
+    if args.decoded_cache is not None:
+        app.decoded_cache = DecodedCache(args.decoded_cache)
+        get_atlas().loader = app.decoded_cache.load_image
     if args.editor:
         app.mode = "edit"
     else:
@@ -731,7 +799,7 @@ if __name__ == "__main__":
 
     if args.level:
         # Load the level - we have to wait for the init event before
-        if args.level.endswith(".lsf"):
+        if args.level.endswith(".lsf") or args.level.endswith(".lsb"):
             app.connect(gui.INIT, lambda *x: app.load_campaign(args.level))
         else:
             app.connect(gui.INIT, lambda *x: app.load_level(args.level), None)
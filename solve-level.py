@@ -0,0 +1,87 @@
+#!/usr/bin/python
+"""
+@copyright: 2012, Niels Thykier <niels@thykier.net>
+@license:
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions
+are met:
+
+ * Redistributions of source code must retain the above copyright
+   notice, this list of conditions and the following disclaimer.
+
+ * Redistributions in binary form must reproduce the above copyright
+   notice, this list of conditions and the following disclaimer in
+   the documentation and/or other materials provided with the
+   distribution.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+"AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS
+FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+OWNER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED
+TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+"""
+
+import argparse
+import sys
+import time
+
+from chrono.model.level import EditableLevel
+from chrono.solver import Solver, format_solution, solution_score
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve ChronoShift levels")
+    parser.add_argument('--max-clones', type=int, default=3, dest="max_clones",
+                        help="The maximum number of clones (time-jumps) to try")
+    parser.add_argument('--max-turns', type=int, default=40, dest="max_turns",
+                        help="The maximum number of turns in a time-jump")
+    parser.add_argument('--max-states', type=int, default=200000, dest="max_states",
+                        help="Give up after visiting this many states")
+    parser.add_argument('--write', action="store_true", default=False,
+                        help="Store the solution in the level file (unless the"
+                        + " level already has a solution with a lower or equal"
+                        + " score)")
+    parser.add_argument('levels', type=str, nargs='+',
+                        help="The level files to solve")
+    args = parser.parse_args()
+
+    unsolved = 0
+    for lvlfile in args.levels:
+        lvl = EditableLevel()
+        lvl.load_level(lvlfile)
+        solver = Solver(lvl, max_clones=args.max_clones, max_turns=args.max_turns,
+                        max_states=args.max_states)
+        start = time.time()
+        timelines = solver.solve()
+        duration = time.time() - start
+        if timelines is None:
+            print "E: lvl %s: No solution found (%d states, %.2fs)" \
+                % (lvl.name, solver.states_visited, duration)
+            unsolved += 1
+            continue
+        solution = format_solution(timelines)
+        score = solution_score(solution)
+        print "I: lvl %s: Solved with score %d using %d clone(s) (%d states, %.2fs)" \
+            % (lvl.name, score, len(timelines), solver.states_visited, duration)
+        if solver.state_limit_reached:
+            print "W: lvl %s: The score may not be minimal (the state limit was reached)" \
+                % lvl.name
+        elif not solver.is_minimal:
+            print "W: lvl %s: The score may not be minimal (some paths were merged)" \
+                % lvl.name
+        print "Solution:%s" % solution
+        if args.write:
+            old = lvl.get_metadata_raw("solution")
+            if old is not None and solution_score(old) <= score:
+                print "W: lvl %s: Not replacing the existing solution (score %d)" \
+                    % (lvl.name, solution_score(old))
+                continue
+            lvl.set_metadata_raw("solution", solution)
+            lvl.print_lvl(lvlfile)
+    if unsolved:
+        sys.exit(1)
@@ -2,11 +2,41 @@
 
 LVL_EXT := .txt
 LSF_EXT := .lsf
+BUILD_DIR := build
+# Levels with a solution (some levels are deliberately left unsolved)
+LEVELS := $(shell grep -l '^Solution:' levels/*$(LVL_EXT))
 CAMPAIGNS := $(wildcard levels/*$(LSF_EXT))
 SOLVABLE_TESTS := $(wildcard tests/solvable/*$(LVL_EXT))
 TIMEPARADOX_TESTS := $(wildcard tests/time-paradox/*$(LVL_EXT))
+LEVEL_CACHE := $(BUILD_DIR)/level-cache
+BUNDLES := $(patsubst levels/%$(LSF_EXT),$(BUILD_DIR)/%.lsb,$(CAMPAIGNS))
 
-check: $(SOLVABLE_TESTS) $(TIMEPARADOX_TESTS) $(CAMPAIGNS)
+check: $(SOLVABLE_TESTS) $(TIMEPARADOX_TESTS) $(CAMPAIGNS) check-level-cache check-bundles
 	./check-level.py --solvable $(SOLVABLE_TESTS)
 	./check-level.py --test-time-paradox $(TIMEPARADOX_TESTS)
 	./check-campaign.py $(CAMPAIGNS)
+
+# Compile the levels into a fresh level cache (one .lvc per level) and
+# check that the levels loaded from the compiled files are solvable.
+$(LEVEL_CACHE): $(LEVELS)
+	rm -rf $@
+	mkdir -p $@
+	./check-level.py --level-cache $@ $(LEVELS)
+
+check-level-cache: $(LEVEL_CACHE)
+	test -n "$$(ls $(LEVEL_CACHE)/*.lvc)"
+	./check-level.py --solvable --level-cache $(LEVEL_CACHE) $(LEVELS)
+
+# Pack each campaign with its levels into a bundle and check the
+# levels read from the bundle.
+$(BUILD_DIR)/%.lsb: levels/%$(LSF_EXT) $(wildcard levels/*$(LVL_EXT))
+	mkdir -p $(BUILD_DIR)
+	./bundle-campaign.py $< $@
+
+check-bundles: $(BUNDLES)
+	./check-campaign.py $(BUNDLES)
+
+clean:
+	rm -rf $(BUILD_DIR)
+
+.PHONY: check check-level-cache check-bundles clean